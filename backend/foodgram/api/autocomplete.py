@@ -0,0 +1,55 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredients
+from .cache import INGREDIENTS_VERSION_KEY, get_version
+from .replicas import primary_reads
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+class IngredientIndex:
+
+    def __init__(self, rows):
+        rows = sorted((normalize(name), pk) for pk, name in rows)
+        self.keys = [row[0] for row in rows]
+        self.ids = [row[1] for row in rows]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        position = bisect_left(self.keys, prefix)
+        ids = []
+        for key, pk in zip(
+            self.keys[position:position + limit],
+            self.ids[position:position + limit],
+        ):
+            if not key.startswith(prefix):
+                break
+            ids.append(pk)
+
+        return ids
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None}
+
+
+def get_ingredient_index():
+    version = get_version(INGREDIENTS_VERSION_KEY)
+    if _state['version'] != version:
+        with _lock:
+            if _state['version'] != version:
+                with primary_reads():
+                    _state['index'] = IngredientIndex(
+                        Ingredients.objects.values_list(
+                            'id', 'name'
+                        ).iterator()
+                    )
+                _state['version'] = version
+
+    return _state['index']
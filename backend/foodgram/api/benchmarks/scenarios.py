@@ -0,0 +1,211 @@
+import base64
+from collections import namedtuple
+
+from recipes.models import (FavouriteRecipe, Ingredients, Recipes,
+                            ShoppingCartRecipe, Tags)
+from users.models import Subscription, User
+from ..pagination import KeysetPagination
+from .seed import PASSWORD, make_image
+
+ANON = ('anon',)
+AUTH = ('auth',)
+BOTH = ('anon', 'auth')
+
+Scenario = namedtuple(
+    'Scenario',
+    ('name', 'method', 'path', 'roles', 'data', 'warm', 'conditional'),
+)
+Scenario.__new__.__defaults__ = (None, False, False)
+
+# Страница ленты по курсору из середины должна начинать чтение индекса с
+# позиции курсора, а не сканировать его с фильтром: сортировка и индекс.
+CURSOR_PLANS = (
+    (('cooking_time', 'id'), 'recipes_cooking_time_id_idx'),
+    (('-favorites_count', '-id'), 'recipes_favorites_count_id_idx'),
+)
+
+
+def cursor_page(ordering):
+    paginator = KeysetPagination()
+    paginator.ordering = list(ordering)
+    queryset = Recipes.objects.order_by(*ordering)
+    row = queryset[queryset.count() // 2]
+    position = [getattr(row, field.lstrip('-')) for field in ordering]
+
+    return queryset.filter(
+        paginator.after(position)
+    )[:paginator.max_limit + 1]
+
+
+def build_context(viewer):
+    favourites = FavouriteRecipe.objects.filter(user=viewer)
+    cart = ShoppingCartRecipe.objects.filter(user=viewer)
+    followed = Subscription.objects.filter(subscriber=viewer)
+    free_recipe = Recipes.objects.exclude(author=viewer).exclude(
+        id__in=favourites.values('recipe')
+    ).exclude(id__in=cart.values('recipe')).first()
+    tag, other_tag = Tags.objects.all()[:2]
+
+    return {
+        'viewer_email': viewer.email,
+        'author': Recipes.objects.exclude(author=viewer).first().author_id,
+        'own_recipe': Recipes.objects.filter(author=viewer).first().id,
+        'recipe': free_recipe.id,
+        'favourite': favourites.first().recipe_id,
+        'cart_recipe': cart.first().recipe_id,
+        'batch_recipes': list(Recipes.objects.exclude(
+            id__in=cart.values('recipe')
+        ).exclude(
+            id__in=favourites.values('recipe')
+        ).values_list('id', flat=True)[:20]),
+        'cart_recipes': list(cart.values_list('recipe_id', flat=True)),
+        'followed': followed.first().target_user_id,
+        'unfollowed': User.objects.exclude(id=viewer.id).exclude(
+            id__in=followed.values('target_user')
+        ).first().id,
+        'ingredient': Ingredients.objects.first().id,
+        'search': free_recipe.ingredients.order_by(
+            'name'
+        ).first().name.split()[0],
+        'tag': tag.id,
+        'tag_slug': tag.slug,
+        'other_tag_slug': other_tag.slug,
+        'image': 'data:image/png;base64,{}'.format(
+            base64.b64encode(make_image()).decode()
+        ),
+    }
+
+
+def recipe_payload(context):
+    return {
+        'name': 'Рецепт из бенчмарка',
+        'text': 'Описание',
+        'image': context['image'],
+        'tags': [context['tag']],
+        'ingredients': [{'id': context['ingredient'], 'amount': 10}],
+        'cooking_time': 15,
+    }
+
+
+SCENARIOS = (
+    Scenario('api-root', 'get', '/api/', BOTH),
+    Scenario(
+        'token-login', 'post', '/api/auth/token/login/', ANON,
+        lambda context: {
+            'email': context['viewer_email'],
+            'password': PASSWORD,
+        },
+    ),
+    Scenario('token-logout', 'post', '/api/auth/token/logout/', AUTH),
+    Scenario(
+        'set-password', 'post', '/api/users/set_password/', AUTH,
+        lambda context: {
+            'current_password': PASSWORD,
+            'new_password': 'new-benchmark-password',
+        },
+    ),
+    Scenario('user-list', 'get', '/api/users/', BOTH),
+    Scenario(
+        'user-create', 'post', '/api/users/', ANON,
+        lambda context: {
+            'email': 'new-user@foodgram.ru',
+            'username': 'new-user',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': PASSWORD,
+        },
+    ),
+    Scenario('user-list-warm', 'get', '/api/users/', AUTH, warm=True),
+    Scenario('user-list-not-modified', 'get', '/api/users/', BOTH,
+             conditional=True),
+    Scenario('user-detail', 'get', '/api/users/{author}/', BOTH),
+    Scenario('user-me', 'get', '/api/users/me/', AUTH),
+    Scenario(
+        'user-subscriptions', 'get',
+        '/api/users/subscriptions/?recipes_limit=3', AUTH,
+    ),
+    Scenario(
+        'user-subscriptions-cursor', 'get',
+        '/api/users/subscriptions/?cursor=&recipes_limit=3', AUTH,
+    ),
+    Scenario('user-subscribe', 'post', '/api/users/{unfollowed}/subscribe/',
+             AUTH),
+    Scenario('user-unsubscribe', 'delete', '/api/users/{followed}/subscribe/',
+             AUTH),
+    Scenario('recipe-list', 'get', '/api/recipes/', BOTH),
+    Scenario('recipe-list-warm', 'get', '/api/recipes/', AUTH, warm=True),
+    Scenario('recipe-list-cursor', 'get', '/api/recipes/?cursor=', BOTH),
+    Scenario('recipe-list-cursor-ordering', 'get',
+             '/api/recipes/?cursor=&ordering=cooking_time', BOTH),
+    Scenario('recipe-list-not-modified', 'get', '/api/recipes/', BOTH,
+             conditional=True),
+    Scenario('recipe-search', 'get', '/api/recipes/?name={search}', BOTH),
+    Scenario('recipe-list-tags', 'get', '/api/recipes/?tags={tag_slug}', BOTH),
+    Scenario('recipe-list-author', 'get', '/api/recipes/?author={author}',
+             BOTH),
+    Scenario('recipe-list-favorited', 'get', '/api/recipes/?is_favorited=1',
+             AUTH),
+    Scenario('recipe-list-in-cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', AUTH),
+    Scenario('recipe-list-filtered', 'get',
+             '/api/recipes/?tags={tag_slug}&tags={other_tag_slug}'
+             '&is_favorited=1&is_in_shopping_cart=1', AUTH),
+    Scenario('recipe-list-filtered-cursor', 'get',
+             '/api/recipes/?cursor=&tags={tag_slug}&author={author}', BOTH),
+    Scenario('recipe-list-ordering', 'get',
+             '/api/recipes/?ordering=cooking_time', BOTH),
+    Scenario('recipe-list-popular', 'get',
+             '/api/recipes/?ordering=-favorites_count', BOTH),
+    Scenario('recipe-list-popular-cursor', 'get',
+             '/api/recipes/?cursor=&ordering=-favorites_count', BOTH),
+    Scenario('recipe-create', 'post', '/api/recipes/', AUTH, recipe_payload),
+    Scenario('recipe-detail', 'get', '/api/recipes/{recipe}/', BOTH),
+    Scenario('recipe-detail-not-modified', 'get', '/api/recipes/{recipe}/',
+             BOTH, conditional=True),
+    Scenario('recipe-update', 'patch', '/api/recipes/{own_recipe}/', AUTH,
+             recipe_payload),
+    Scenario('recipe-delete', 'delete', '/api/recipes/{own_recipe}/', AUTH),
+    Scenario('recipe-favorite', 'post', '/api/recipes/{recipe}/favorite/',
+             AUTH),
+    Scenario('recipe-unfavorite', 'delete',
+             '/api/recipes/{favourite}/favorite/', AUTH),
+    Scenario('recipe-cart-add', 'post',
+             '/api/recipes/{recipe}/shopping_cart/', AUTH),
+    Scenario('recipe-cart-remove', 'delete',
+             '/api/recipes/{cart_recipe}/shopping_cart/', AUTH),
+    Scenario('recipe-favorite-batch', 'post', '/api/recipes/favorite/', AUTH,
+             lambda context: {'recipes': context['batch_recipes']}),
+    Scenario('recipe-cart-batch-add', 'post', '/api/recipes/shopping_cart/',
+             AUTH, lambda context: {'recipes': context['batch_recipes']}),
+    Scenario('recipe-cart-batch-remove', 'delete',
+             '/api/recipes/shopping_cart/', AUTH,
+             lambda context: {'recipes': context['cart_recipes']}),
+    Scenario('download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', AUTH),
+    Scenario('download-shopping-cart-csv', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', AUTH),
+    Scenario('download-shopping-cart-txt', 'get',
+             '/api/recipes/download_shopping_cart/?format=txt', AUTH),
+    Scenario('download-shopping-cart-json', 'get',
+             '/api/recipes/download_shopping_cart/?format=json', AUTH),
+    Scenario('download-shopping-cart-cached', 'get',
+             '/api/recipes/download_shopping_cart/', AUTH, warm=True),
+    Scenario('download-shopping-cart-csv-cached', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', AUTH,
+             warm=True),
+    Scenario('ingredient-list', 'get', '/api/ingredients/', BOTH),
+    Scenario('ingredient-search', 'get', '/api/ingredients/?name=ка', BOTH),
+    Scenario('ingredient-list-cached', 'get', '/api/ingredients/', BOTH,
+             warm=True),
+    Scenario('ingredient-search-cached', 'get', '/api/ingredients/?name=ка',
+             BOTH, warm=True),
+    Scenario('ingredient-search-not-modified', 'get',
+             '/api/ingredients/?name=ка', BOTH, conditional=True),
+    Scenario('ingredient-detail', 'get', '/api/ingredients/{ingredient}/',
+             BOTH),
+    Scenario('tag-list', 'get', '/api/tags/', BOTH),
+    Scenario('tag-list-cached', 'get', '/api/tags/', BOTH, warm=True),
+    Scenario('tag-list-not-modified', 'get', '/api/tags/', BOTH,
+             conditional=True),
+    Scenario('tag-detail', 'get', '/api/tags/{tag}/', BOTH),
+)
@@ -0,0 +1,142 @@
+import csv
+import io
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.counters import COUNTERS, actual_count
+from api.search import update_search_documents
+from recipes.models import (FavouriteRecipe, Ingredients, IngredientsRecipe,
+                            Recipes, ShoppingCartRecipe, Tags)
+from users.models import Subscription, User
+
+DEFAULT_VOLUME = {
+    'users': 50,
+    'recipes': 300,
+    'tags': 6,
+    'ingredients_per_recipe': 8,
+    'favorites_per_user': 20,
+    'carts_per_user': 10,
+    'subscriptions_per_user': 10,
+}
+PASSWORD = 'benchmark-password'
+RANDOM_SEED = 42
+
+
+def make_image(size=(64, 64), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, image_format)
+
+    return buffer.getvalue()
+
+
+def load_ingredients(path):
+    with open(path, encoding='utf-8', newline='') as csv_file:
+        Ingredients.objects.bulk_create(
+            (
+                Ingredients(name=name, measurement_unit=unit)
+                for name, unit in csv.reader(csv_file)
+            ),
+            batch_size=500,
+        )
+
+
+def seed(ingredients_path, volume):
+    rng = random.Random(RANDOM_SEED)
+    load_ingredients(ingredients_path)
+    ingredient_ids = list(Ingredients.objects.values_list('id', flat=True))
+
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        User(
+            username=f'user{number}',
+            email=f'user{number}@foodgram.ru',
+            first_name=f'Имя{number}',
+            last_name=f'Фамилия{number}',
+            password=password,
+        )
+        for number in range(volume['users'])
+    )
+    users = list(User.objects.order_by('id'))
+    Token.objects.bulk_create(
+        Token(user=user, key=Token.generate_key()) for user in users
+    )
+
+    Tags.objects.bulk_create(
+        Tags(name=f'Тег {number}', color=f'#{number:06X}', slug=f'tag{number}')
+        for number in range(volume['tags'])
+    )
+    tag_ids = list(Tags.objects.values_list('id', flat=True))
+
+    image = default_storage.save(
+        'recipes/images/benchmark.png', ContentFile(make_image())
+    )
+    Recipes.objects.bulk_create(
+        Recipes(
+            author=users[number % len(users)],
+            name=f'Рецепт {number}',
+            text=f'Описание рецепта {number}. ' * 20,
+            image=image,
+            cooking_time=rng.randint(1, 180),
+        )
+        for number in range(volume['recipes'])
+    )
+    recipe_ids = list(Recipes.objects.values_list('id', flat=True))
+
+    tags_through = Recipes.tags.through
+    tags_through.objects.bulk_create(
+        tags_through(recipes_id=recipe_id, tags_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, min(2, len(tag_ids)))
+    )
+    IngredientsRecipe.objects.bulk_create(
+        (
+            IngredientsRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, volume['ingredients_per_recipe']
+            )
+        ),
+        batch_size=500,
+    )
+    update_search_documents(recipe_ids)
+
+    for model, per_user in (
+        (FavouriteRecipe, volume['favorites_per_user']),
+        (ShoppingCartRecipe, volume['carts_per_user']),
+    ):
+        model.objects.bulk_create(
+            (
+                model(user=user, recipe_id=recipe_id)
+                for user in users
+                for recipe_id in rng.sample(
+                    recipe_ids, min(per_user, len(recipe_ids))
+                )
+            ),
+            batch_size=500,
+        )
+    Subscription.objects.bulk_create(
+        (
+            Subscription(subscriber=user, target_user=target)
+            for user in users
+            for target in rng.sample(
+                [other for other in users if other != user],
+                min(volume['subscriptions_per_user'], len(users) - 1),
+            )
+        ),
+        batch_size=500,
+    )
+    for model, field, related_model, related_field in COUNTERS:
+        model.objects.update(**{
+            field: actual_count(related_model, related_field)
+        })
+
+    return users[0]
@@ -0,0 +1,187 @@
+import hashlib
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.utils import timezone
+
+from recipes.models import FavouriteRecipe, Recipes, ShoppingCartRecipe
+from users.models import Subscription
+
+INGREDIENTS_VERSION_KEY = 'version:ingredients'
+TAGS_VERSION_KEY = 'version:tags'
+RECIPE_SEARCH_VERSION_KEY = 'version:recipe_search'
+COUNTERS = (
+    'shopping_list_hits',
+    'shopping_list_misses',
+)
+MEMBERSHIPS = {
+    'favorites': (FavouriteRecipe, 'user_id', 'recipe_id'),
+    'shopping_cart': (ShoppingCartRecipe, 'user_id', 'recipe_id'),
+    'subscriptions': (Subscription, 'subscriber_id', 'target_user_id'),
+}
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+
+        return cache.get(key)
+
+    return version
+
+
+def bump_versions(keys):
+    versions = {key: uuid4().hex for key in keys}
+    cache.set_many(versions, None)
+
+    return versions
+
+
+def cart_version_key(user_id):
+    return 'version:shopping_cart:{}'.format(user_id)
+
+
+def bump_cart_versions(user_ids):
+    bump_versions(cart_version_key(user_id) for user_id in user_ids)
+
+
+_pending = threading.local()
+
+
+def defer_until_commit(name, recipe_ids, flush):
+    # Рецепты копятся в очереди потока и обрабатываются одним запросом
+    # после фиксации транзакции, сколько бы строк ни изменилось. Если
+    # транзакция откатится, рецепты останутся в очереди и будут
+    # обработаны при следующей фиксации.
+    vars(_pending).setdefault(name, set()).update(recipe_ids)
+    transaction.on_commit(flush)
+
+
+def take_pending(name):
+    return vars(_pending).pop(name, set())
+
+
+def invalidate_recipe_carts(recipe_ids):
+    defer_until_commit('cart_recipe_ids', recipe_ids, flush_recipe_carts)
+
+
+def flush_recipe_carts():
+    recipe_ids = take_pending('cart_recipe_ids')
+    if not recipe_ids:
+        return
+    bump_cart_versions(ShoppingCartRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True).distinct())
+
+
+def touch_recipes(recipe_ids):
+    # Изменение строк ингредиентов или тегов сдвигает дату изменения
+    # рецепта.
+    defer_until_commit('touched_recipe_ids', recipe_ids, flush_touched_recipes)
+
+
+def flush_touched_recipes():
+    recipe_ids = take_pending('touched_recipe_ids')
+    if not recipe_ids:
+        return
+    Recipes.objects.filter(pk__in=recipe_ids).update(modified=timezone.now())
+
+
+def shopping_list_key(user, export_format):
+    return 'shopping_list:{}:{}:{}:{}'.format(
+        user.id,
+        export_format,
+        get_version(cart_version_key(user.id)),
+        get_version(INGREDIENTS_VERSION_KEY),
+    )
+
+
+def cache_stream(key, chunks):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(parts), settings.SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def membership_key(kind, user_id):
+    return 'membership:{}:{}'.format(kind, user_id)
+
+
+def load_memberships(user):
+    if not user.is_authenticated:
+        return {kind: frozenset() for kind in MEMBERSHIPS}
+    keys = {kind: membership_key(kind, user.id) for kind in MEMBERSHIPS}
+    cached = cache.get_many(keys.values())
+    memberships = {
+        kind: cached[key] for kind, key in keys.items() if key in cached
+    }
+    missing = [kind for kind in MEMBERSHIPS if kind not in memberships]
+    if not missing:
+        return memberships
+
+    # Все недостающие множества собираются одним запросом через UNION ALL.
+    querysets = []
+    for kind in missing:
+        model, user_field, value_field = MEMBERSHIPS[kind]
+        querysets.append(model.objects.filter(
+            **{user_field: user.id}
+        ).annotate(
+            kind=Value(kind, output_field=CharField())
+        ).values_list('kind', value_field).order_by())
+    rows = {kind: set() for kind in missing}
+    for kind, value in querysets[0].union(*querysets[1:], all=True):
+        rows[kind].add(value)
+    loaded = {kind: frozenset(values) for kind, values in rows.items()}
+    cache.set_many(
+        {keys[kind]: values for kind, values in loaded.items()},
+        settings.MEMBERSHIP_CACHE_TIMEOUT,
+    )
+    memberships.update(loaded)
+
+    return memberships
+
+
+def get_memberships(request):
+    # Избранное, корзина и подписки читаются один раз на запрос, после
+    # чего каждый флаг в ответе проверяется по множеству.
+    if not hasattr(request, '_memberships'):
+        request._memberships = load_memberships(request.user)
+
+    return request._memberships
+
+
+def invalidate_membership(kind, user_id):
+    # Ключ удаляется сразу и ещё раз после фиксации, чтобы параллельный
+    # запрос не успел сохранить в кэш состояние до записи.
+    key = membership_key(kind, user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def reference_key(version_key, version, params):
+    return 'reference:{}:{}:{}'.format(
+        version_key, version, hashlib.sha1(repr(params).encode()).hexdigest()
+    )
+
+
+def increment(counter):
+    key = 'counter:{}'.format(counter)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_counters():
+    values = cache.get_many('counter:{}'.format(name) for name in COUNTERS)
+
+    return {
+        name: values.get('counter:{}'.format(name), 0) for name in COUNTERS
+    }
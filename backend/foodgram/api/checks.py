@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    if settings.DEBUG or settings.CACHES['default'][
+        'BACKEND'
+    ] not in LOCAL_CACHE_BACKENDS:
+        return []
+
+    return [Warning(
+        'Кэш не общий для процессов: сброс версий, списков избранного и '
+        'подписок, закрепление за основной базой и метрики видны только '
+        'процессу, который их записал.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION, например Memcached.',
+        id='api.W001',
+    )]
+
+
+@register()
+def replica_pin_cache_check(app_configs, **kwargs):
+    # Без общего кэша клиент, записавший через один процесс, читает через
+    # другой с реплики и не видит своих изменений.
+    if settings.DEBUG or not settings.DATABASE_READ_ALIASES or settings.CACHES[
+        'default'
+    ]['BACKEND'] not in LOCAL_CACHE_BACKENDS:
+        return []
+
+    return [Warning(
+        'Чтение с реплик включено, а закрепление клиента за основной базой '
+        'хранится в кэше одного процесса.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION, например Memcached.',
+        id='api.W002',
+    )]
@@ -0,0 +1,62 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import FavouriteRecipe, Recipes, ShoppingCartRecipe
+from users.models import Subscription, User
+
+# Счётчики рецепта для списков избранного и корзины.
+LIST_COUNTERS = {
+    'favorites': 'favorites_count',
+    'shopping_cart': 'shopping_cart_count',
+}
+# Счётчик: модель, поле, модель со связанными строками и поле связи.
+COUNTERS = (
+    (Recipes, 'favorites_count', FavouriteRecipe, 'recipe'),
+    (Recipes, 'shopping_cart_count', ShoppingCartRecipe, 'recipe'),
+    (User, 'recipes_count', Recipes, 'author'),
+    (User, 'subscribers_count', Subscription, 'target_user'),
+)
+
+
+def counter_deltas(deltas):
+    # UPDATE ... SET поле = поле + delta выполняется в базе, поэтому
+    # параллельные запросы не теряют изменений друг друга.
+    return {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    }
+
+
+def adjust_recipe_counters(recipe_ids, **deltas):
+    # Дата изменения не трогается: счётчики не входят в ответ рецепта, а
+    # новый порядок ленты по популярности меняет ETag страницы сам.
+    Recipes.objects.filter(pk__in=recipe_ids).update(
+        **counter_deltas(deltas)
+    )
+
+
+def recount_recipe_counters(recipe_ids, kind):
+    # Счётчик пересчитывается по строкам списка тем же UPDATE, поэтому
+    # параллельные пакетные запросы с пересекающимися рецептами не
+    # сдвигают его на дельту, посчитанную по устаревшему чтению.
+    field = LIST_COUNTERS[kind]
+    related_model = next(
+        related for model, name, related, _ in COUNTERS if name == field
+    )
+    Recipes.objects.filter(pk__in=recipe_ids).update(
+        **{field: actual_count(related_model, 'recipe')}
+    )
+
+
+def adjust_user_counters(user_id, **deltas):
+    User.objects.filter(pk=user_id).update(**counter_deltas(deltas))
+
+
+def actual_count(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
@@ -1,6 +1,12 @@
 import django_filters as filters
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
 
-from recipes.models import Recipes
+from recipes.models import FavouriteRecipe, Recipes, ShoppingCartRecipe
+from .autocomplete import get_ingredient_index
+from .search import search_recipes
 
 
 class CustomQueryFilter(filters.FilterSet):
@@ -12,30 +18,84 @@ class CustomQueryFilter(filters.FilterSet):
         fields = ['tags']
 
     def filter_queryset(self, queryset):
-        if self.request.user.is_authenticated:
-            is_favorited = self.request.query_params.get('is_favorited')
-            is_in_shopping_cart = self.request.query_params.get(
-                'is_in_shopping_cart'
+        # Каждое условие — полусоединение id IN (подзапрос), поэтому строки
+        # рецептов не размножаются и DISTINCT по всем колонкам не нужен.
+        params = self.request.query_params
+        user = self.request.user
+        author = params.get('author', '')
+        if author.isdigit():
+            queryset = queryset.filter(author_id=author)
+        tags = params.getlist('tags')
+        if tags:
+            queryset = queryset.filter(
+                pk__in=Recipes.tags.through.objects.filter(
+                    tags__slug__in=tags
+                ).values('recipes_id')
             )
-            tags = self.request.query_params.getlist('tags')
-            author_param = self.request.query_params.get('author')
-            if author_param:
-                queryset = queryset.filter(author__id=author_param)
-            if is_favorited:
-                queryset = queryset.filter(
-                    favourited_by__user=self.request.user
-                )
-            if is_in_shopping_cart:
+        if not user.is_authenticated:
+            return queryset
+        for param, model in (
+            ('is_favorited', FavouriteRecipe),
+            ('is_in_shopping_cart', ShoppingCartRecipe),
+        ):
+            if params.get(param):
                 queryset = queryset.filter(
-                    added_to_cart_by__user=self.request.user
+                    pk__in=model.objects.filter(user=user).values('recipe_id')
                 )
-            if tags:
 
-                return queryset.filter(tags__slug__in=tags).distinct()
-        tags = self.request.query_params.getlist('tags')
+        return queryset
+
 
-        if tags:
+class RecipeSearchFilter(BaseFilterBackend):
 
-            return queryset.filter(tags__slug__in=tags).distinct()
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(api_settings.SEARCH_PARAM, '')
+        if not query.strip():
+            return queryset
 
-        return queryset
+        return search_recipes(queryset, query)
+
+
+def ingredient_search_params(request):
+    # Только то, от чего зависит результат поиска: по этим же значениям
+    # строится ключ кэша справочника ингредиентов.
+    prefix = request.query_params.get(api_settings.SEARCH_PARAM, '').strip()
+    if not prefix:
+        return None
+    try:
+        limit = min(
+            int(request.query_params.get('limit', '')),
+            settings.INGREDIENT_SEARCH_LIMIT,
+        )
+    except ValueError:
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+
+    return prefix, limit
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+
+    def filter_queryset(self, request, queryset, view):
+        params = ingredient_search_params(request)
+        if view.action != 'list' or params is None:
+            return queryset
+        prefix, limit = params
+
+        if settings.INGREDIENT_SEARCH_IN_MEMORY:
+            # Индекс отдаёт только id в нужном порядке, а дальше по цепочке
+            # идёт обычный queryset с выборкой по первичному ключу.
+            ingredient_ids = get_ingredient_index().search(prefix, limit)
+            if not ingredient_ids:
+                return queryset.none()
+
+            return queryset.filter(pk__in=ingredient_ids).order_by(Case(
+                *(
+                    When(pk=pk, then=Value(position))
+                    for position, pk in enumerate(ingredient_ids)
+                ),
+                output_field=IntegerField(),
+            ))
+
+        return queryset.filter(
+            name__istartswith=prefix
+        ).order_by('name', 'id')[:limit]
@@ -0,0 +1,112 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import Recipes
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(
+        buffer,
+        settings.RECIPE_IMAGE_FORMAT,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+    )
+
+    return buffer.getvalue()
+
+
+def variant_names(recipe):
+    return [
+        getattr(recipe, 'image_' + name).name
+        for name in settings.RECIPE_IMAGE_VARIANTS
+    ]
+
+
+def delete_files(names):
+    for name in names:
+        if name:
+            default_storage.delete(name)
+
+
+def generate_variants(recipe_id, stale=()):
+    # stale — варианты заменённой картинки, их файлы удаляются здесь же.
+    delete_files(stale)
+    recipe = Recipes.objects.filter(pk=recipe_id).only(
+        'image', 'image_thumbnail', 'image_card'
+    ).first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    previous = variant_names(recipe)
+    with recipe.image.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    extension = settings.RECIPE_IMAGE_FORMAT.lower()
+    fields = {}
+    for name, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        field = getattr(recipe, 'image_' + name)
+        field.save(
+            '{}.{}'.format(stem, extension),
+            ContentFile(render_variant(image, size)),
+            save=False,
+        )
+        fields['image_' + name] = field.name
+    # Если пока шла обработка рецепту загрузили новую картинку,
+    # устаревшие варианты не записываются и их файлы удаляются. Иначе
+    # удаляются файлы прежних вариантов.
+    updated = Recipes.objects.filter(pk=recipe_id, image=source).update(
+        modified=timezone.now(), **fields
+    )
+    delete_files(previous if updated else fields.values())
+
+
+def run_in_worker(recipe_id, stale):
+    # У потока пула своё соединение с базой, его нужно закрывать самому.
+    try:
+        generate_variants(recipe_id, stale)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить изображения рецепта %s', recipe_id
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(recipe, stale=()):
+    # Уменьшенные копии строятся после коммита и вне цикла запроса, пока
+    # они не готовы клиенты получают адрес оригинала.
+    recipe_id = recipe.pk
+    stale = [name for name in stale if name]
+    if settings.RECIPE_IMAGE_ASYNC:
+        transaction.on_commit(
+            lambda: executor.submit(run_in_worker, recipe_id, stale)
+        )
+    else:
+        transaction.on_commit(lambda: generate_variants(recipe_id, stale))
+
+
+def discard_variants(recipe):
+    names = variant_names(recipe)
+    transaction.on_commit(lambda: delete_files(names))
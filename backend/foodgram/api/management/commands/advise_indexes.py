@@ -0,0 +1,433 @@
+import json
+import os
+import re
+from collections import OrderedDict, namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, migrations, models
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import FavouriteRecipe, Ingredients, Recipes, Tags
+from users.models import User
+
+# Пустой локальный кэш: запросы доходят до базы, а общий кэш не
+# затрагивается.
+ISOLATED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'advise-indexes',
+    },
+}
+COLUMN = r'"(?P<table>\w+)"\."(?P<column>\w+)"'
+ALIAS_RE = re.compile(r'"(\w+)" (U\d+)\b')
+PREDICATE_RE = re.compile(
+    COLUMN + r'\s*(?P<operator>=|IN\b|LIKE\b|>=|<=|<|>)', re.IGNORECASE
+)
+JOIN_RE = re.compile(r'=\s*' + COLUMN)
+ORDER_RE = re.compile(
+    r'ORDER BY ((?:"\w+"\."\w+"(?: ASC| DESC)?(?:, )?)+)', re.IGNORECASE
+)
+ORDER_COLUMN_RE = re.compile(COLUMN + r'(?P<direction> ASC| DESC)?')
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+FINDING_LABELS = {
+    'seq_scan': 'последовательное чтение',
+    'sort': 'сортировка',
+    'nested_loop': 'вложенный цикл по',
+}
+
+Finding = namedtuple('Finding', ('kind', 'table', 'rows', 'detail'))
+
+
+class QueryRecorder:
+
+    def __init__(self):
+        self.label = None
+        self.queries = OrderedDict()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.setdefault(sql, (self.label, params))
+
+        return execute(sql, params, many, context)
+
+
+def hot_paths(viewer):
+    recipe = Recipes.objects.order_by('id').first()
+    tag = Tags.objects.order_by('id').first()
+    ingredient = Ingredients.objects.order_by('id').first()
+    if recipe is None or tag is None or ingredient is None:
+        raise CommandError(
+            'В базе нет рецептов, тегов или ингредиентов для анализа'
+        )
+
+    return (
+        ('Лента рецептов', '/api/recipes/'),
+        ('Рецепты автора', '/api/recipes/?author={}'.format(
+            recipe.author_id
+        )),
+        ('Фильтр по тегу', '/api/recipes/?tags={}'.format(tag.slug)),
+        ('Избранное', '/api/recipes/?is_favorited=1'),
+        ('Корзина', '/api/recipes/?is_in_shopping_cart=1'),
+        ('Сортировка по времени', '/api/recipes/?ordering=cooking_time'),
+        ('Лента по курсору', '/api/recipes/?cursor='),
+        ('Рецепт', '/api/recipes/{}/'.format(recipe.id)),
+        ('Список покупок', '/api/recipes/download_shopping_cart/?format=txt'),
+        ('Пользователи', '/api/users/'),
+        ('Пользователь', '/api/users/{}/'.format(recipe.author_id)),
+        ('Подписки', '/api/users/subscriptions/?recipes_limit=3'),
+        ('Поиск ингредиентов', '/api/ingredients/?name={}'.format(
+            ingredient.name[:2]
+        )),
+    )
+
+
+def resolve_aliases(sql):
+    for table, alias in set(ALIAS_RE.findall(sql)):
+        sql = sql.replace('"{}".'.format(alias), '"{}".'.format(table))
+
+    return sql
+
+
+def order_columns(sql, table):
+    columns = []
+    for clause in ORDER_RE.findall(sql):
+        for match in ORDER_COLUMN_RE.finditer(clause):
+            if match.group('table') == table:
+                columns.append((
+                    match.group('column'),
+                    (match.group('direction') or '').strip().upper() == 'DESC',
+                ))
+
+    return columns
+
+
+def suggest_columns(sql, table, primary_key):
+    # Сначала столбцы из условий равенства и соединений, затем один
+    # столбец диапазона или столбцы сортировки. Поиск по первичному ключу
+    # уже обслуживает его индекс.
+    sql = resolve_aliases(sql)
+    equal = []
+    ranged = []
+    for match in PREDICATE_RE.finditer(sql):
+        if match.group('table') != table:
+            continue
+        target = equal if match.group('operator').upper() in (
+            '=', 'IN'
+        ) else ranged
+        if match.group('column') not in target:
+            target.append(match.group('column'))
+    for match in JOIN_RE.finditer(sql):
+        if (
+            match.group('table') == table
+            and match.group('column') not in equal
+        ):
+            equal.append(match.group('column'))
+    columns = [(column, False) for column in equal if column != primary_key]
+    if ranged:
+        return columns + [(ranged[0], False)]
+
+    return columns + [
+        column for column in order_columns(sql, table)
+        if column[0] not in equal
+    ]
+
+
+def walk_postgresql(node):
+    loops = node.get('Actual Loops', 1)
+    rows = node.get('Actual Rows', node['Plan Rows']) * loops
+    children = node.get('Plans', ())
+    if node['Node Type'] == 'Seq Scan':
+        yield Finding(
+            'seq_scan',
+            node['Relation Name'],
+            rows + node.get('Rows Removed by Filter', 0) * loops,
+            node.get('Filter', ''),
+        )
+    elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+        yield Finding(
+            'sort', relation_name(node), rows, ', '.join(node['Sort Key'])
+        )
+    elif node['Node Type'] == 'Nested Loop' and len(children) == 2:
+        outer = children[0]
+        yield Finding(
+            'nested_loop',
+            relation_name(children[1]),
+            outer.get('Actual Rows', outer['Plan Rows']) * outer.get(
+                'Actual Loops', 1
+            ),
+            node.get('Join Filter', ''),
+        )
+    for child in children:
+        yield from walk_postgresql(child)
+
+
+def relation_name(node):
+    if 'Relation Name' in node:
+        return node['Relation Name']
+    for child in node.get('Plans', ()):
+        name = relation_name(child)
+        if name is not None:
+            return name
+
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для запросов основных эндпоинтов API, '
+            'находит последовательные чтения, сортировки и вложенные циклы '
+            'по большим таблицам и предлагает миграцию с индексами')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, от имени которого выполняются запросы',
+        )
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='С какого числа строк таблица считается большой',
+        )
+        parser.add_argument(
+            '--write',
+            action='store_true',
+            help='Записать предложенные миграции в каталоги приложений',
+        )
+
+    def handle(self, *args, **options):
+        viewer = self.get_viewer(options['user'])
+        self.min_rows = options['min_rows']
+        self.table_sizes = {}
+        self.tables = set(connection.introspection.table_names())
+        recorder = self.record_queries(viewer)
+
+        suggestions = OrderedDict()
+        for sql, (label, params) in recorder.queries.items():
+            findings = [
+                finding for finding in self.explain(sql, params)
+                if finding.table in self.tables and self.is_large(finding)
+            ]
+            if not findings:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write('  ' + sql[:300])
+            for finding in findings:
+                self.stdout.write('  {} {} ({} строк) {}'.format(
+                    FINDING_LABELS[finding.kind],
+                    finding.table,
+                    finding.rows,
+                    finding.detail,
+                ).rstrip())
+                self.suggest(suggestions, sql, finding.table)
+
+        if not suggestions:
+            self.stdout.write(self.style.SUCCESS(
+                'Недостающих индексов не найдено'
+            ))
+            return
+        self.write_migrations(suggestions, options['write'])
+
+    def get_viewer(self, email):
+        users = User.objects.order_by('id')
+        if email:
+            viewer = users.filter(email=email).first()
+        else:
+            viewer = users.filter(
+                id__in=FavouriteRecipe.objects.values('user_id')
+            ).first() or users.first()
+        if viewer is None:
+            raise CommandError('Пользователь не найден')
+
+        return viewer
+
+    def record_queries(self, viewer):
+        client = APIClient()
+        client.force_authenticate(viewer)
+        recorder = QueryRecorder()
+        with override_settings(
+            CACHES=ISOLATED_CACHES,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ):
+            for label, path in hot_paths(viewer):
+                recorder.label = '{}: {}'.format(label, path)
+                with connection.execute_wrapper(recorder):
+                    response = client.get(path)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                if response.status_code != 200:
+                    self.stderr.write('{}: статус {}'.format(
+                        path, response.status_code
+                    ))
+
+        return recorder
+
+    def explain(self, sql, params):
+        # Запросы эндпоинтов только читают данные, поэтому EXPLAIN ANALYZE
+        # можно выполнять без отката.
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+
+                return self.read_sqlite_plan(sql, cursor.fetchall())
+            cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return list(walk_postgresql(plan[0]['Plan']))
+
+    def read_sqlite_plan(self, sql, rows):
+        # SQLite соединяет таблицы только вложенными циклами: полное чтение
+        # таблицы не первым на своём уровне повторяется для каждой строки
+        # внешнего цикла.
+        findings = []
+        outer_levels = set()
+        for _, parent, _, detail in rows:
+            scan = SQLITE_SCAN_RE.match(detail)
+            if scan:
+                table = scan.group(1)
+                findings.append(Finding(
+                    'nested_loop' if parent in outer_levels else 'seq_scan',
+                    table,
+                    self.table_size(table),
+                    '',
+                ))
+            ordered = ORDER_COLUMN_RE.search(' '.join(
+                ORDER_RE.findall(resolve_aliases(sql))
+            ))
+            if detail == SQLITE_SORT and ordered:
+                table = ordered.group('table')
+                findings.append(Finding(
+                    'sort', table, self.table_size(table), 'ORDER BY'
+                ))
+            if detail.startswith(('SCAN', 'SEARCH')):
+                outer_levels.add(parent)
+
+        return findings
+
+    def table_size(self, table):
+        if table not in self.tables:
+            return 0
+        if table not in self.table_sizes:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class '
+                        'WHERE relname = %s',
+                        (table,),
+                    )
+                else:
+                    cursor.execute('SELECT COUNT(*) FROM {}'.format(
+                        connection.ops.quote_name(table)
+                    ))
+                row = cursor.fetchone()
+            self.table_sizes[table] = row[0] if row else 0
+
+        return self.table_sizes[table]
+
+    def is_large(self, finding):
+        if finding.kind == 'seq_scan':
+            return self.table_size(finding.table) >= self.min_rows
+
+        return finding.rows >= self.min_rows
+
+    def suggest(self, suggestions, sql, table):
+        model = next((
+            model for model in apps.get_models(include_auto_created=True)
+            if model._meta.db_table == table
+        ), None)
+        if model is None:
+            return
+        fields = {
+            field.column: field.name for field in model._meta.concrete_fields
+        }
+        columns = [
+            (column, descending) for column, descending in suggest_columns(
+                sql, table, model._meta.pk.column
+            ) if column in fields
+        ]
+        if not columns or self.is_indexed(table, columns):
+            return
+        index = models.Index(fields=[
+            ('-' if descending else '') + fields[column]
+            for column, descending in columns
+        ])
+        index.set_name_with_model(model)
+        app_suggestions = suggestions.setdefault(
+            model._meta.app_label, OrderedDict()
+        )
+        app_suggestions.setdefault((table, tuple(columns)), (model, index))
+
+    def is_indexed(self, table, columns):
+        names = [column for column, _ in columns]
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, table
+            )
+        for constraint in constraints.values():
+            if not (
+                constraint['index']
+                or constraint['unique']
+                or constraint['primary_key']
+            ):
+                continue
+            if (constraint['columns'] or [])[:len(names)] == names:
+                return True
+
+        return False
+
+    def write_migrations(self, suggestions, write):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        for app_label, indexes in suggestions.items():
+            leaf = loader.graph.leaf_nodes(app_label)[0]
+            migration = migrations.Migration(
+                '{:04d}_advised_indexes'.format(
+                    MigrationAutodetector.parse_number(leaf[1]) + 1
+                ),
+                app_label,
+            )
+            migration.dependencies = [leaf]
+            migration.operations = [
+                self.index_operation(model, index, columns)
+                for (_, columns), (model, index) in indexes.items()
+            ]
+            writer = MigrationWriter(migration)
+            if not write:
+                self.stdout.write(self.style.MIGRATE_HEADING(writer.path))
+                self.stdout.write(writer.as_string())
+                continue
+            with open(writer.path, 'w', encoding='utf-8') as file:
+                file.write(writer.as_string())
+            self.stdout.write(self.style.SUCCESS(
+                'Миграция записана в {}'.format(
+                    os.path.relpath(writer.path)
+                )
+            ))
+
+    def index_operation(self, model, index, columns):
+        if not model._meta.auto_created:
+            return migrations.AddIndex(
+                model_name=model._meta.model_name, index=index
+            )
+        # Таблицы связей ManyToManyField создаются автоматически и
+        # не принимают Meta.indexes.
+        quote = connection.ops.quote_name
+
+        return migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                index.name,
+                quote(model._meta.db_table),
+                ', '.join(
+                    quote(column) + (' DESC' if descending else '')
+                    for column, descending in columns
+                ),
+            ),
+            'DROP INDEX IF EXISTS {}'.format(index.name),
+        )
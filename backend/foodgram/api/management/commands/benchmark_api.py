@@ -0,0 +1,254 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from django.urls import get_resolver, resolve
+from rest_framework.test import APIClient
+
+from api.benchmarks.scenarios import (CURSOR_PLANS, SCENARIOS,
+                                      build_context, cursor_page)
+from api.benchmarks.seed import DEFAULT_VOLUME, seed
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'benchmarks',
+    'baseline.json',
+)
+INGREDIENTS_PATH = os.path.join(
+    settings.BASE_DIR, '..', '..', 'data', 'ingredients.csv'
+)
+
+
+def collect_callbacks(patterns):
+    callbacks = set()
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            callbacks |= collect_callbacks(pattern.url_patterns)
+        else:
+            callbacks.add(pattern.callback)
+
+    return callbacks
+
+
+class Command(BaseCommand):
+    help = ('Наполняет временную базу данными и замеряет число SQL-запросов, '
+            'время и пиковую память для каждого эндпоинта API')
+
+    def add_arguments(self, parser):
+        for key, value in DEFAULT_VOLUME.items():
+            parser.add_argument(
+                '--{}'.format(key.replace('_', '-')),
+                type=int,
+                default=value,
+                dest=key,
+            )
+        parser.add_argument('--ingredients', default=INGREDIENTS_PATH)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--baseline', default=BASELINE_PATH)
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Перезаписать файл с эталонными значениями',
+        )
+        parser.add_argument(
+            '--only',
+            help='Запускать только сценарии, в имени которых есть подстрока',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['ingredients']):
+            raise CommandError('Файл ингредиентов не найден: {}'.format(
+                options['ingredients']
+            ))
+        volume = {key: options[key] for key in DEFAULT_VOLUME}
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+                viewer = seed(options['ingredients'], volume)
+                results = self.run_scenarios(viewer, options)
+                self.check_plans()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        if options['update_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(
+                    {
+                        'volume': volume,
+                        'queries': {
+                            key: result['queries']
+                            for key, result in sorted(results.items())
+                        },
+                    },
+                    file,
+                    indent=2,
+                    ensure_ascii=False,
+                )
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                'Эталон сохранён в {}'.format(options['baseline'])
+            ))
+            return
+        self.compare(results, volume, options['baseline'])
+
+    def run_scenarios(self, viewer, options):
+        context = build_context(viewer)
+        clients = {'anon': APIClient(), 'auth': APIClient()}
+        clients['auth'].credentials(
+            HTTP_AUTHORIZATION='Token {}'.format(viewer.auth_token.key)
+        )
+        covered = set()
+        results = {}
+        for scenario in SCENARIOS:
+            if options['only'] and options['only'] not in scenario.name:
+                continue
+            path = scenario.path.format(**context)
+            covered.add(resolve(path.split('?')[0]).func)
+            data = scenario.data(context) if scenario.data else None
+            for role in scenario.roles:
+                key = '{}:{}'.format(scenario.name, role)
+                results[key] = self.measure(
+                    clients[role], scenario.method, path, data,
+                    options['repeat'], scenario.warm, scenario.conditional,
+                )
+                if results[key]['status'] >= 400:
+                    raise CommandError('{} вернул статус {}'.format(
+                        key, results[key]['status']
+                    ))
+
+        missing = collect_callbacks(get_resolver('api.urls').url_patterns)
+        if not options['only'] and missing - covered:
+            raise CommandError('Нет сценариев для маршрутов: {}'.format(
+                ', '.join(sorted(
+                    callback.__name__ for callback in missing - covered
+                ))
+            ))
+
+        return results
+
+    def check_plans(self):
+        failures = []
+        for ordering, index in CURSOR_PLANS:
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    # На маленькой выборке планировщик может предпочесть
+                    # полный просмотр, проверяется сама возможность
+                    # чтения индекса диапазоном.
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+                        cursor.execute('SET LOCAL enable_sort = off')
+                plan = cursor_page(ordering).explain()
+            # SQLite: SEARCH ... USING INDEX, PostgreSQL: Index Cond.
+            if index not in plan or not (
+                'SEARCH' in plan or 'Index Cond' in plan
+            ):
+                failures.append('{}:\n{}'.format(','.join(ordering), plan))
+        if failures:
+            raise CommandError(
+                'Страница по курсору не читает индекс диапазоном:\n'
+                + '\n'.join(failures)
+            )
+
+    def request(self, client, method, path, data, headers=None):
+        with transaction.atomic():
+            if method == 'get':
+                response = client.get(path, **(headers or {}))
+            else:
+                response = getattr(client, method)(path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+
+        return response
+
+    def measure(self, client, method, path, data, repeat, warm,
+                conditional):
+        cache.clear()
+        headers = {}
+        if warm or conditional:
+            response = self.request(client, method, path, data)
+            if conditional:
+                headers['HTTP_IF_NONE_MATCH'] = response['ETag']
+        tracemalloc.start()
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            response = self.request(client, method, path, data, headers)
+        query_count = sum(len(queries) for queries in captured)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.request(client, method, path, data, headers)
+            timings.append(time.perf_counter() - started)
+
+        return {
+            'status': response.status_code,
+            'queries': query_count,
+            'time_ms': statistics.median(timings) * 1000 if timings else 0,
+            'peak_kib': peak_memory / 1024,
+        }
+
+    def report(self, results):
+        self.stdout.write('{:<40} {:>7} {:>10} {:>10}'.format(
+            'сценарий', 'запросы', 'мс', 'КиБ'
+        ))
+        for key, result in results.items():
+            self.stdout.write('{:<40} {:>7} {:>10.1f} {:>10.0f}'.format(
+                key, result['queries'], result['time_ms'], result['peak_kib']
+            ))
+
+    def compare(self, results, volume, baseline_path):
+        if not os.path.exists(baseline_path):
+            raise CommandError(
+                'Эталон не найден, запустите команду с --update-baseline'
+            )
+        with open(baseline_path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['volume'] != volume:
+            self.stdout.write(self.style.WARNING(
+                'Объём данных отличается от эталонного, '
+                'число запросов может быть несопоставимо'
+            ))
+
+        regressions = []
+        for key, result in results.items():
+            expected = baseline['queries'].get(key)
+            if expected is None:
+                self.stdout.write(self.style.WARNING(
+                    '{}: нет в эталоне'.format(key)
+                ))
+            elif result['queries'] > expected:
+                regressions.append('{}: {} запросов вместо {}'.format(
+                    key, result['queries'], expected
+                ))
+            elif result['queries'] < expected:
+                self.stdout.write(self.style.SUCCESS(
+                    '{}: {} запросов вместо {}, обновите эталон'.format(
+                        key, result['queries'], expected
+                    )
+                ))
+        if regressions:
+            raise CommandError(
+                'Число SQL-запросов выросло:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
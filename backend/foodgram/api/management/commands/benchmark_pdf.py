@@ -0,0 +1,75 @@
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from api.utils import CustomPDF, load_font, load_logo
+
+
+def sample_shopping_list(lines):
+    return [
+        {
+            'name': f'Ингредиент номер {number}',
+            'measurement_unit': 'г',
+            'total_amount': Decimal(number * 10),
+        }
+        for number in range(lines)
+    ]
+
+
+def render_cold(ingredients):
+    # Воспроизводит прежнюю схему: шрифт и логотип разбираются заново,
+    # документ пишется во временный файл и читается обратно.
+    load_font.cache_clear()
+    load_logo.cache_clear()
+    shopping_list = CustomPDF()
+    shopping_list.print_chapter(ingredients)
+    file_descriptor, filename = tempfile.mkstemp(suffix='.pdf')
+    os.close(file_descriptor)
+    try:
+        shopping_list.output(filename)
+        with open(filename, 'rb') as pdf_file:
+            return pdf_file.read()
+    finally:
+        os.remove(filename)
+
+
+def render_warm(ingredients):
+    return CustomPDF().render(ingredients)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время и выделения памяти на генерацию PDF со списком '
+            'покупок с разбором ресурсов на каждый запрос и с кешем процесса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        ingredients = sample_shopping_list(options['lines'])
+        render_warm(ingredients)
+
+        self.stdout.write('{:<10} {:>12} {:>12} {:>10}'.format(
+            'режим', 'медиана, мс', 'пик, КиБ', 'размер, Б'
+        ))
+        for name, render in (('до', render_cold), ('после', render_warm)):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                render(ingredients)
+                timings.append(time.perf_counter() - started)
+            tracemalloc.start()
+            content = render(ingredients)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write('{:<10} {:>12.1f} {:>12.0f} {:>10}'.format(
+                name,
+                statistics.median(timings) * 1000,
+                peak_memory / 1024,
+                len(content),
+            ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.images import generate_variants
+from recipes.models import Recipes
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии изображений для рецептов, '
+            'у которых их ещё нет')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(Q(image_thumbnail='') | Q(image_card=''))
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+        for recipe_id in recipe_ids:
+            generate_variants(recipe_id)
+        self.stdout.write(self.style.SUCCESS(
+            'Обработано рецептов: {}'.format(len(recipe_ids))
+        ))
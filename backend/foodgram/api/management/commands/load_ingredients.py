@@ -0,0 +1,242 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import INGREDIENTS_VERSION_KEY, bump_versions
+from recipes.models import Ingredients
+
+DATA_DIR = os.path.join(settings.BASE_DIR, '..', '..', 'data')
+CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n[],'
+HEADER = ['name', 'measurement_unit']
+
+# Ключ сравнивается без учёта регистра и лишних пробелов, в том числе у
+# строк, которые уже лежат в таблице.
+INSERT_NEW_SQL = r'''
+    INSERT INTO recipes_ingredients (name, measurement_unit)
+    SELECT DISTINCT ON (lower(new.name), lower(new.measurement_unit))
+        new.name, new.measurement_unit
+    FROM ingredients_load AS new
+    WHERE NOT EXISTS (
+        SELECT 1 FROM recipes_ingredients AS old
+        WHERE lower(regexp_replace(btrim(old.name), '\s+', ' ', 'g'))
+            = lower(new.name)
+        AND lower(regexp_replace(
+            btrim(old.measurement_unit), '\s+', ' ', 'g'
+        )) = lower(new.measurement_unit)
+    )
+'''
+
+
+def normalize(value):
+    return ' '.join(value.split())
+
+
+def ingredient_key(name, measurement_unit):
+    return (
+        normalize(name).casefold(),
+        normalize(measurement_unit).casefold(),
+    )
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2 and row[:2] != HEADER:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    # Массив (или JSON Lines) разбирается по одному объекту по мере чтения
+    # файла, весь файл в память не загружается.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    finished = False
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if finished:
+                    raise CommandError('Некорректный JSON')
+            else:
+                yield json_row(item)
+                continue
+        elif finished:
+            return
+        chunk = file.read(CHUNK_SIZE)
+        finished = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def json_row(item):
+    try:
+        return item['name'], item['measurement_unit']
+    except (KeyError, TypeError):
+        raise CommandError(
+            'Ожидался объект с полями name и measurement_unit: {}'.format(
+                item
+            )
+        )
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class CSVStream:
+    # Файлоподобный объект для COPY: строки превращаются в CSV по мере
+    # того, как их читает драйвер.
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def read(self, size=-1):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in self.rows:
+            writer.writerow(row)
+            if 0 <= size <= buffer.tell():
+                break
+
+        return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов из CSV или JSON. Повторный '
+            'запуск добавляет только новые пары (название, единица)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'),
+            help='Путь к файлу или «-» для чтения из стандартного ввода',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY даже на PostgreSQL',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path != '-' and not os.path.exists(path):
+            raise CommandError('Файл не найден: {}'.format(path))
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                'Неизвестный формат файла {}, укажите --format'.format(path)
+            )
+        if options['batch_size'] <= 0:
+            raise CommandError('Размер пачки должен быть больше нуля')
+
+        self.rows_read = 0
+        started = time.perf_counter()
+        with self.open(path) as file:
+            rows = self.clean(READERS[file_format](file))
+            with transaction.atomic():
+                if connection.vendor == 'postgresql' and not options[
+                    'no_copy'
+                ]:
+                    created = self.copy_rows(rows)
+                else:
+                    created = self.insert_batches(rows, options['batch_size'])
+        elapsed = time.perf_counter() - started
+        if created:
+            bump_versions((INGREDIENTS_VERSION_KEY,))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Прочитано строк: {}, добавлено: {}, пропущено: {}. '
+            '{:.2f} с, {:.0f} строк/с'.format(
+                self.rows_read,
+                created,
+                self.rows_read - created,
+                elapsed,
+                self.rows_read / elapsed if elapsed else 0,
+            )
+        ))
+
+    def open(self, path):
+        if path == '-':
+            return io.TextIOWrapper(
+                sys.stdin.buffer, encoding='utf-8', newline=''
+            )
+
+        return open(path, encoding='utf-8', newline='')
+
+    def clean(self, rows):
+        for name, measurement_unit in rows:
+            self.rows_read += 1
+            name = normalize(name)
+            measurement_unit = normalize(measurement_unit)
+            if name and measurement_unit:
+                yield name, measurement_unit
+
+    def copy_rows(self, rows):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredients_load '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredients_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                CSVStream(rows),
+            )
+            cursor.execute(INSERT_NEW_SQL)
+
+            return cursor.rowcount
+
+    def insert_batches(self, rows, batch_size):
+        known = {
+            ingredient_key(name, measurement_unit)
+            for name, measurement_unit in Ingredients.objects.values_list(
+                'name', 'measurement_unit'
+            ).iterator()
+        }
+        created = 0
+        for batch in batches(rows, batch_size):
+            new = []
+            for name, measurement_unit in batch:
+                key = ingredient_key(name, measurement_unit)
+                if key not in known:
+                    known.add(key)
+                    new.append(Ingredients(
+                        name=name, measurement_unit=measurement_unit
+                    ))
+            Ingredients.objects.bulk_create(new)
+            created += len(new)
+
+        return created
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from api.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, корзины, рецептов и '
+            'подписчиков и исправляет строки, где они разошлись с данными')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя',
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            with transaction.atomic():
+                count = actual_count(related_model, related_field)
+                drifted = list(model.objects.annotate(
+                    actual=count
+                ).exclude(**{field: F('actual')}).values_list(
+                    'pk', field, 'actual'
+                ))
+                if drifted and not options['dry_run']:
+                    model.objects.filter(
+                        pk__in=[pk for pk, _, _ in drifted]
+                    ).update(**{field: count})
+            for pk, stored, actual in drifted[:10]:
+                self.stdout.write('  {} #{}: {} вместо {}'.format(
+                    model._meta.verbose_name, pk, stored, actual
+                ))
+            self.stdout.write('{}.{}: расхождений {}'.format(
+                model.__name__, field, len(drifted)
+            ))
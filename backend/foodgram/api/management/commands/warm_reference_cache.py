@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from api.checks import LOCAL_CACHE_BACKENDS
+from api.views import IngredientsListView, TagsViewSet
+from recipes.models import Tags
+
+
+class Command(BaseCommand):
+    help = ('Заранее кладёт в кэш ответы справочников тегов и ингредиентов, '
+            'чтобы после выкладки они отдавались без обращения к базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--search',
+            nargs='*',
+            default=(),
+            help='Поисковые запросы ингредиентов, которые тоже нужно прогреть',
+        )
+
+    def handle(self, *args, **options):
+        # Кэш в памяти процесса исчезнет вместе с командой, и серверу
+        # прогретые ответы не достанутся.
+        if settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS:
+            raise CommandError(
+                'Прогрев имеет смысл только с общим кэшем: задайте '
+                'CACHE_BACKEND и CACHE_LOCATION, например Memcached.'
+            )
+        factory = APIRequestFactory()
+        tags_list = TagsViewSet.as_view({'get': 'list'})
+        tags_detail = TagsViewSet.as_view({'get': 'retrieve'})
+        ingredients_list = IngredientsListView.as_view({'get': 'list'})
+
+        requests = [(tags_list, '/api/tags/', {})]
+        requests.extend(
+            (tags_detail, '/api/tags/{}/'.format(pk), {'pk': pk})
+            for pk in Tags.objects.values_list('pk', flat=True)
+        )
+        requests.append((ingredients_list, '/api/ingredients/', {}))
+        requests.extend(
+            (ingredients_list, '/api/ingredients/?name={}'.format(term), {})
+            for term in options['search']
+        )
+        for view, path, kwargs in requests:
+            response = view(factory.get(path), **kwargs)
+            if response.status_code != 200:
+                self.stderr.write('{}: статус {}'.format(
+                    path, response.status_code
+                ))
+        self.stdout.write(self.style.SUCCESS(
+            'Прогрето ответов: {}'.format(len(requests))
+        ))
@@ -0,0 +1,244 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_counters
+
+PHASES = ('db', 'serializer', 'render', 'pdf')
+ROUTES_KEY = 'metrics:routes'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_request = threading.local()
+_pending = defaultdict(int)
+_routes = set()
+_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def start_request():
+    _request.phases = defaultdict(float)
+    _request.active = set()
+    _request.queries = 0
+
+
+def finish_request():
+    phases = vars(_request).pop('phases', {})
+    queries = vars(_request).pop('queries', 0)
+    vars(_request).pop('active', None)
+
+    return phases, queries
+
+
+def add_phase(phase, seconds):
+    phases = getattr(_request, 'phases', None)
+    if phases is not None:
+        phases[phase] += seconds
+
+
+@contextmanager
+def timed(phase):
+    # Вложенные вызовы той же фазы (сериализатор внутри сериализатора)
+    # учитываются один раз. Вне HTTP-запроса ничего не записывается.
+    active = getattr(_request, 'active', None)
+    if active is None or phase in active:
+        yield
+        return
+    active.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        active.discard(phase)
+        add_phase(phase, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    _request.queries += 1
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class TimedDataMixin:
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+_timed_classes = {}
+
+
+def timed_serializer(serializer):
+    # Представления отдают сериализатор для ответа через эту функцию:
+    # он получает подкласс, у которого data вместе с ленивыми выборками
+    # внутри попадает в фазу serializer. Подкласс создаётся один раз на
+    # класс сериализатора.
+    serializer_class = type(serializer)
+    if issubclass(serializer_class, TimedDataMixin):
+        return serializer
+    if serializer_class not in _timed_classes:
+        _timed_classes[serializer_class] = type(
+            serializer_class.__name__, (TimedDataMixin, serializer_class), {}
+        )
+    serializer.__class__ = _timed_classes[serializer_class]
+
+    return serializer
+
+
+def server_timing(phases, queries, total):
+    entries = ['db;dur={:.1f};desc="{} SQL"'.format(
+        phases.get('db', 0) * 1000, queries
+    )]
+    entries.extend(
+        '{};dur={:.1f}'.format(phase, phases[phase] * 1000)
+        for phase in PHASES[1:] if phase in phases
+    )
+    entries.append('total;dur={:.1f}'.format(total * 1000))
+
+    return ', '.join(entries)
+
+
+def metric_key(kind, route, method, extra=''):
+    return 'metrics:{}:{}:{}:{}'.format(kind, method, route, extra)
+
+
+def microseconds(seconds):
+    return int(seconds * 1000000)
+
+
+def observe(route, method, duration, phases, queries):
+    # Замеры копятся в памяти процесса и раз в METRICS_FLUSH_SECONDS
+    # переносятся в общий кэш, откуда их читает /secure/metrics/ для всех
+    # процессов сразу.
+    bucket = next(
+        (str(le) for le in settings.METRICS_BUCKETS if duration <= le),
+        '+Inf',
+    )
+    with _lock:
+        _routes.add((route, method))
+        _pending[metric_key('bucket', route, method, bucket)] += 1
+        _pending[metric_key('count', route, method)] += 1
+        _pending[metric_key('sum', route, method)] += microseconds(duration)
+        _pending[metric_key('queries', route, method)] += queries
+        for phase, seconds in phases.items():
+            _pending[
+                metric_key('phase', route, method, phase)
+            ] += microseconds(seconds)
+        due = (
+            time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_SECONDS
+        )
+    if due:
+        flush()
+
+
+def flush():
+    global _flushed_at
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        routes = set(_routes)
+        _flushed_at = time.monotonic()
+    for key, value in pending.items():
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+    known = {tuple(route) for route in cache.get(ROUTES_KEY, [])}
+    if not routes <= known:
+        cache.set(ROUTES_KEY, sorted(known | routes), None)
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def metric_lines(name, kind, description, samples):
+    lines = [
+        '# HELP {} {}'.format(name, description),
+        '# TYPE {} {}'.format(name, kind),
+    ]
+    for suffix, labels, value in samples:
+        lines.append('{}{}{{{}}} {}'.format(name, suffix, ','.join(
+            '{}="{}"'.format(key, label(text)) for key, text in labels
+        ), value))
+
+    return lines
+
+
+def histogram_samples(routes, buckets, values):
+    for route, method in routes:
+        labels = (('route', route), ('method', method))
+        total = 0
+        for bucket in buckets:
+            total += values.get(metric_key('bucket', route, method, bucket), 0)
+            yield '_bucket', labels + (('le', bucket),), total
+        yield '_sum', labels, values.get(
+            metric_key('sum', route, method), 0
+        ) / 1000000
+        yield '_count', labels, values.get(
+            metric_key('count', route, method), 0
+        )
+
+
+def render_metrics():
+    flush()
+    routes = [tuple(route) for route in cache.get(ROUTES_KEY, [])]
+    buckets = [str(le) for le in settings.METRICS_BUCKETS] + ['+Inf']
+    keys = []
+    for route, method in routes:
+        keys.extend(
+            metric_key('bucket', route, method, bucket) for bucket in buckets
+        )
+        keys.extend(
+            metric_key(kind, route, method)
+            for kind in ('count', 'sum', 'queries')
+        )
+        keys.extend(
+            metric_key('phase', route, method, phase) for phase in PHASES
+        )
+    values = cache.get_many(keys)
+    lines = metric_lines(
+        'foodgram_request_duration_seconds',
+        'histogram',
+        'Время ответа по маршрутам',
+        histogram_samples(routes, buckets, values),
+    )
+    lines += metric_lines(
+        'foodgram_request_phase_seconds_total',
+        'counter',
+        'Время по фазам запроса (db входит в serializer и pdf, если запросы '
+        'выполнялись внутри них)',
+        (
+            ('', (('route', route), ('method', method), ('phase', phase)),
+             values.get(metric_key('phase', route, method, phase), 0)
+             / 1000000)
+            for route, method in routes for phase in PHASES
+        ),
+    )
+    lines += metric_lines(
+        'foodgram_request_sql_queries_total',
+        'counter',
+        'Число SQL-запросов',
+        (
+            ('', (('route', route), ('method', method)),
+             values.get(metric_key('queries', route, method), 0))
+            for route, method in routes
+        ),
+    )
+    lines += metric_lines(
+        'foodgram_cache_events_total',
+        'counter',
+        'Попадания и промахи кэша',
+        (
+            ('', (('event', event),), value)
+            for event, value in get_counters().items()
+        ),
+    )
+
+    return '\n'.join(lines) + '\n'
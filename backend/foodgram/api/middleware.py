@@ -0,0 +1,134 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import (add_phase, finish_request, observe, record_query,
+                      server_timing, start_request)
+from .nplusone import QueryRepetitionDetector
+from .replicas import (is_pinned, pin_key, pin_to_primary, read_from_primary,
+                       read_from_replica)
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+class InstrumentationMiddleware:
+    # Для каждого запроса считает SQL-запросы и время в базе,
+    # сериализаторах, отрисовке ответа и генерации PDF, отдаёт их в
+    # заголовке Server-Timing и копит гистограммы по маршрутам для
+    # /secure/metrics/.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_request()
+        started = time.perf_counter()
+        try:
+            with wrap_connections(record_query):
+                response = self.get_response(request)
+        except BaseException:
+            finish_request()
+            raise
+        if response.streaming:
+            # Выгрузки потоком выполняют запросы, пока отдаётся тело, уже
+            # после выхода из middleware: замер закрывается в конце потока,
+            # а заголовок Server-Timing к этому времени уже отправлен.
+            response.streaming_content = self.stream(
+                request, response.streaming_content, started
+            )
+
+            return response
+        phases, queries = finish_request()
+        duration = time.perf_counter() - started
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(
+                phases, queries, duration
+            )
+        self.record(request, duration, phases, queries)
+
+        return response
+
+    def stream(self, request, content, started):
+        try:
+            with wrap_connections(record_query):
+                yield from content
+        finally:
+            phases, queries = finish_request()
+            self.record(
+                request, time.perf_counter() - started, phases, queries
+            )
+
+    def record(self, request, duration, phases, queries):
+        match = request.resolver_match
+        observe(
+            match.view_name if match else 'unmatched',
+            request.method,
+            duration,
+            phases,
+            queries,
+        )
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: add_phase('render', time.perf_counter() - started)
+        )
+
+        return response
+
+
+class QueryRepetitionMiddleware:
+    # Включается NPLUSONE_DETECTION: в режиме log пишет предупреждение о
+    # запросах, повторившихся в одном HTTP-запросе больше
+    # NPLUSONE_THRESHOLD раз, в режиме raise (в тестах) падает с ошибкой.
+
+    def __init__(self, get_response):
+        if settings.NPLUSONE_DETECTION not in ('log', 'raise'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = QueryRepetitionDetector(settings.NPLUSONE_THRESHOLD)
+        with wrap_connections(detector):
+            response = self.get_response(request)
+        # Ответ 500 означает, что исключение уже обработано: отчёт о
+        # повторах не должен подменять настоящую ошибку.
+        if response.status_code < 500:
+            detector.check(request)
+
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    # Безопасные запросы читают с реплики. Успешная запись закрепляет
+    # клиента за основной базой на READ_YOUR_WRITES_SECONDS, чтобы он сразу
+    # видел свои изменения, даже если реплика отстаёт.
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_READ_ALIASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = pin_key(request)
+        safe = request.method in SAFE_METHODS
+        if safe and not is_pinned(key):
+            read_from_replica()
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_primary()
+        if not safe and key is not None and response.status_code < 400:
+            pin_to_primary(key)
+
+        return response
@@ -0,0 +1,191 @@
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_memberships, get_version, reference_key
+from .metrics import timed_serializer
+from .replicas import primary_reads
+
+
+class ConditionalGetMixin:
+    # Представление описывает состояние ресурса методами
+    # get_list_validators и get_detail_validators: части ETag и дату
+    # изменения. Если они совпадают с заголовками If-None-Match или
+    # If-Modified-Since, ответ 304 отдаётся без выборки и сериализации.
+    # Для списков дата не передаётся: по максимальной дате изменения
+    # нельзя заметить удаление записи.
+    #
+    # Состояние больших списков (list_modified_fields) — число строк,
+    # последний id и даты изменения — считается одним агрегатом. До
+    # выборки страницы он выполняется только для условных запросов, а
+    # обычному постраничному ответу достаётся вместо COUNT(*) пагинатора.
+    list_modified_fields = ()
+
+    def get_list_validators(self):
+        return None
+
+    def get_detail_validators(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        if self.list_modified_fields and not is_conditional(request):
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(
+                self, '_list_state'
+            ):
+                return response
+
+            return self.add_validators(
+                request, response, *self.get_list_validators()
+            )
+
+        return self.conditional(
+            self.get_list_validators, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(
+            self.get_detail_validators,
+            super().retrieve,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def get_list_state(self):
+        if self.action != 'list' or not self.list_modified_fields:
+            return None
+        if not hasattr(self, '_list_state'):
+            self._list_state = self.filter_queryset(
+                self.get_queryset()
+            ).order_by().aggregate(
+                *(Max(field) for field in self.list_modified_fields),
+                count=Count('id'),
+                last_id=Max('id'),
+            )
+
+        return self._list_state
+
+    def get_membership_state(self, *kinds):
+        memberships = get_memberships(self.request)
+
+        return tuple(sorted(memberships[kind]) for kind in kinds)
+
+    def make_etag(self, request, parts):
+        return quote_etag(hashlib.sha1(repr((
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            parts,
+        )).encode()).hexdigest())
+
+    def get_timestamp(self, request, last_modified):
+        # Флаги избранного, корзины и подписок не имеют даты изменения,
+        # поэтому пользователю с ними отдаётся только ETag.
+        if last_modified is None or request.user.is_authenticated:
+            return None
+
+        return timegm(last_modified.utctimetuple())
+
+    def conditional(self, get_validators, handler, request, *args, **kwargs):
+        validators = get_validators()
+        if validators is None:
+            return handler(request, *args, **kwargs)
+        parts, last_modified = validators
+        response = get_conditional_response(
+            request,
+            etag=self.make_etag(request, parts),
+            last_modified=self.get_timestamp(request, last_modified),
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        return self.add_validators(request, response, parts, last_modified)
+
+    def add_validators(self, request, response, parts, last_modified):
+        response['ETag'] = self.make_etag(request, parts)
+        timestamp = self.get_timestamp(request, last_modified)
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+
+        return response
+
+
+def is_conditional(request):
+    return (
+        'HTTP_IF_NONE_MATCH' in request.META
+        or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    )
+
+
+class ReferenceCacheMixin:
+    # Справочники меняются только через админку, поэтому готовый JSON
+    # хранится в кэше под версией набора данных, которую сбрасывают
+    # сигналы сохранения и удаления. Ключ строится не по строке запроса,
+    # а по действию, первичному ключу и параметрам из
+    # get_reference_params, так что посторонние параметры не плодят
+    # новых записей в кэше.
+    dataset_version_key = None
+
+    def get_dataset_version(self):
+        if not hasattr(self, '_dataset_version'):
+            self._dataset_version = get_version(self.dataset_version_key)
+
+        return self._dataset_version
+
+    def get_reference_params(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+        key = reference_key(
+            self.dataset_version_key,
+            self.get_dataset_version(),
+            (
+                self.action,
+                kwargs.get(self.lookup_url_kwarg or self.lookup_field),
+                self.get_reference_params(),
+            ),
+        )
+        content = cache.get(key)
+        if content is None:
+            with primary_reads():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context(),
+            )
+            cache.set(key, content, settings.REFERENCE_CACHE_TIMEOUT)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += '; charset={}'.format(renderer.charset)
+
+        return HttpResponse(content, content_type=content_type)
+
+
+class SerializerTimingMixin:
+    # Сериализаторы, которые создают обобщённые представления DRF, попадают
+    # в фазу serializer метрик запроса.
+
+    def get_serializer(self, *args, **kwargs):
+        return timed_serializer(super().get_serializer(*args, **kwargs))
@@ -0,0 +1,100 @@
+import logging
+import os
+import re
+import sys
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.fields import Field
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+INSTRUMENTATION_MODULES = ('metrics.py', 'middleware.py', 'nplusone.py')
+
+
+class RepeatedQueryError(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    # Параметры и литералы заменяются на «?», списки IN любой длины
+    # сворачиваются, так что запросы, отличающиеся только значениями,
+    # получают один отпечаток.
+    sql = STRING_LITERAL.sub('?', sql.replace('%s', '?'))
+    sql = PLACEHOLDER_LIST.sub('?', NUMBER_LITERAL.sub('?', sql))
+
+    return ' '.join(sql.split())
+
+
+def serializer_field(frame):
+    # Ближайшее поле сериализатора в стеке вызовов, например
+    # RecipeListSerializer.is_favorited для SerializerMethodField.
+    while frame is not None:
+        field = frame.f_locals.get('self')
+        if isinstance(field, Field) and field.parent is not None:
+            return '{}.{}'.format(
+                type(field.parent).__name__, field.field_name
+            )
+        frame = frame.f_back
+
+    return None
+
+
+def project_stack(frame):
+    return [
+        entry for entry in traceback.extract_stack(frame)
+        if entry.filename.startswith(settings.BASE_DIR)
+        and '-packages' not in entry.filename
+        and os.path.basename(entry.filename) not in INSTRUMENTATION_MODULES
+    ]
+
+
+class QueryRepetitionDetector:
+    # Считает отпечатки SQL-запросов за один HTTP-запрос. Для запроса,
+    # повторившегося больше threshold раз, запоминается стек вызова:
+    # поле сериализатора и строки кода проекта, откуда он пришёл.
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        self.counts[key] += 1
+        if self.counts[key] == self.threshold + 1:
+            frame = sys._getframe(1)
+            self.origins[key] = (
+                serializer_field(frame), project_stack(frame)
+            )
+
+        return execute(sql, params, many, context)
+
+    def report(self, request):
+        if not self.origins:
+            return None
+        parts = ['{} {}: повторяющиеся SQL-запросы'.format(
+            request.method, request.get_full_path()
+        )]
+        for key, (field, stack) in self.origins.items():
+            parts.append('{} раз: {}'.format(self.counts[key], key))
+            if field:
+                parts.append('  поле сериализатора: {}'.format(field))
+            parts.extend(
+                '  ' + line.rstrip()
+                for line in traceback.format_list(stack)
+            )
+
+        return '\n'.join(parts)
+
+    def check(self, request):
+        report = self.report(request)
+        if report is None:
+            return
+        if settings.NPLUSONE_DETECTION == 'raise':
+            raise RepeatedQueryError(report)
+        logger.warning(report)
@@ -0,0 +1,148 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    # Постраничный вывод по номеру страницы остаётся по умолчанию. Клиент,
+    # передавший cursor (для первой страницы пустой), получает страницы по
+    # ключу сортировки: без COUNT(*) и OFFSET, каждая страница читается
+    # диапазоном по индексу.
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    max_limit = 100
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.keyset = False
+            # Представление, которое всё равно считает состояние выборки для
+            # ETag, отдаёт число строк оттуда вместо отдельного COUNT(*).
+            get_state = getattr(view, 'get_list_state', None)
+            state = get_state() if get_state else None
+            self.known_count = state['count'] if state else None
+
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = True
+        self.request = request
+        self.ordering = self.get_ordering(queryset, request, view)
+        self.limit = self.get_limit(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        rows = list(queryset[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        self.page_rows = rows[:self.limit]
+
+        return self.page_rows
+
+    def django_paginator_class(self, queryset, page_size):
+        paginator = Paginator(queryset, page_size)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+
+        return paginator
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_ordering(self, queryset, request, view):
+        # Сортировка берётся из ?ordering, если поле разрешено во
+        # view.ordering_fields, иначе из Meta.ordering модели. Первичный
+        # ключ добавляется в конец, чтобы ключ страницы был уникальным.
+        ordering = list(queryset.model._meta.ordering)
+        allowed = getattr(view, 'ordering_fields', None) or ()
+        param = request.query_params.get(OrderingFilter.ordering_param)
+        if param and param.lstrip('-') in allowed:
+            ordering = [param]
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+
+        return ordering
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if limit <= 0:
+            return self.page_size
+
+        return min(limit, self.max_limit)
+
+    def after(self, position):
+        # (a, b) > (x, y) раскрывается в a > x OR (a = x AND b > y) с учётом
+        # направления каждого поля. По такому OR база не может начать
+        # чтение индекса с нужного места, поэтому первое поле дополнительно
+        # ограничено условием a >= x: оно задаёт начало диапазона.
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = '{}__{}'.format(
+                name, 'lt' if field.startswith('-') else 'gt'
+            )
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        first, value = self.ordering[0], position[0]
+        bound = '{}__{}'.format(
+            first.lstrip('-'), 'lte' if first.startswith('-') else 'gte'
+        )
+
+        return Q(**{bound: value}) & condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(cursor, dict)
+            or cursor.get('o') != self.ordering
+            or not isinstance(cursor.get('k'), list)
+            or len(cursor['k']) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+        return cursor['k']
+
+    def encode_cursor(self, row):
+        position = [
+            getattr(row, field.lstrip('-')) for field in self.ordering
+        ]
+
+        return base64.urlsafe_b64encode(json.dumps(
+            {'o': self.ordering, 'k': position}
+        ).encode()).decode()
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page_rows[-1]),
+        )
@@ -0,0 +1,83 @@
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_KEY = 'db-pin:{}'
+# Токены и сессии читаются с основной базы: только что выданный токен
+# может ещё не доехать до реплики.
+PRIMARY_APPS = {'authtoken', 'sessions'}
+
+_routing = threading.local()
+
+
+def read_from_replica():
+    _routing.read_alias = random.choice(settings.DATABASE_READ_ALIASES)
+
+
+def read_from_primary():
+    _routing.read_alias = None
+
+
+@contextmanager
+def primary_reads():
+    # Кэши под версией набора данных заполняются с основной базы: реплика
+    # может ещё не получить изменение, из-за которого сменилась версия, и
+    # под новой версией оказались бы старые данные.
+    alias = getattr(_routing, 'read_alias', None)
+    read_from_primary()
+    try:
+        yield
+    finally:
+        _routing.read_alias = alias
+
+
+def pin_key(request):
+    # Клиент узнаётся по заголовку с токеном или по cookie сессии, так что
+    # закрепление проверяется до аутентификации и без запросов к базе.
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+
+    return PIN_KEY.format(
+        hashlib.sha256(credentials.encode()).hexdigest()
+    )
+
+
+def pin_to_primary(key):
+    cache.set(key, True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def is_pinned(key):
+    return key is not None and cache.get(key, False)
+
+
+class PrimaryReplicaRouter:
+    # Запись всегда идёт на основную базу, чтение — на реплику, которую
+    # выбрал ReplicaRoutingMiddleware для текущего запроса. Вне запросов
+    # (команды, миграции) всё идёт на основную базу.
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+
+        return getattr(_routing, 'read_alias', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_READ_ALIASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
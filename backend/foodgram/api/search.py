@@ -0,0 +1,300 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
+from django.db import connection
+from django.db.models import Case, Func, IntegerField, Value, When
+
+from recipes.models import IngredientsRecipe, Recipes
+from .cache import (RECIPE_SEARCH_VERSION_KEY, bump_versions,
+                    defer_until_commit, get_version, take_pending)
+from .replicas import primary_reads
+
+SEARCH_CONFIG = 'russian'
+WORD_RE = re.compile(r'[^\W_]+')
+VOWELS = 'аеиоуыэюя'
+
+# Окончания стеммера Snowball для русского языка. Окончания первой группы
+# отрезаются, только если перед ними стоит «а» или «я».
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = ((), (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им',
+    'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая',
+    'яя', 'ою', 'ею',
+))
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+     'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = ((), (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и',
+    'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о',
+    'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+))
+DERIVATIONAL = ('ость', 'ост')
+TIDY_UP = ('ейше', 'ейш', 'нн', 'ь')
+
+
+def regions(word):
+    # RV начинается после первой гласной, R2 — после второго сочетания
+    # «гласная + согласная», считая от начала слова.
+    length = len(word)
+    position = 0
+    marks = []
+    for expect_vowel in (True, False, True, False):
+        while position < length and (word[position] in VOWELS) != (
+            expect_vowel
+        ):
+            position += 1
+        if position == length:
+            break
+        position += 1
+        marks.append(position)
+    rv = marks[0] if marks else length
+    r2 = marks[3] if len(marks) == 4 else length
+
+    return rv, r2
+
+
+def find_ending(word, start, endings):
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return ending
+
+    return None
+
+
+def remove_ending(word, start, groups):
+    preceded, plain = groups
+    ending = find_ending(word, start, preceded + plain)
+    if ending is None:
+        return None
+    cut = len(word) - len(ending)
+    if ending in preceded and not (cut > start and word[cut - 1] in 'ая'):
+        return None
+
+    return word[:cut]
+
+
+def remove_inflection(word, rv):
+    stemmed = remove_ending(word, rv, PERFECTIVE_GERUND)
+    if stemmed is not None:
+        return stemmed
+    reflexive = remove_ending(word, rv, REFLEXIVE)
+    if reflexive is not None:
+        word = reflexive
+    adjective = remove_ending(word, rv, ADJECTIVE)
+    if adjective is not None:
+        participle = remove_ending(adjective, rv, PARTICIPLE)
+
+        return adjective if participle is None else participle
+    for groups in (VERB, NOUN):
+        stemmed = remove_ending(word, rv, groups)
+        if stemmed is not None:
+            return stemmed
+
+    return word
+
+
+def tidy_up(word, rv):
+    ending = find_ending(word, rv, TIDY_UP)
+    if ending in ('ейше', 'ейш'):
+        word = word[:-len(ending)]
+        if find_ending(word, rv, ('нн',)):
+            return word[:-1]
+
+        return word
+    if ending in ('нн', 'ь'):
+        return word[:-1]
+
+    return word
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = regions(word)
+    word = remove_inflection(word, rv)
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    ending = find_ending(word, rv, DERIVATIONAL)
+    if ending and len(word) - len(ending) >= r2:
+        word = word[:-len(ending)]
+
+    return tidy_up(word, rv)
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text)]
+
+
+def build_document(name, text, ingredient_names):
+    return '\n'.join([name, text, *ingredient_names])
+
+
+class RecipeSearchIndex:
+    # Обратный индекс для баз без полнотекстового поиска: основа слова ->
+    # {рецепт: число вхождений}. Ранжирование по BM25.
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, documents):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.total_length = 0
+        for recipe_id, document in documents:
+            self.add(recipe_id, document)
+
+    def add(self, recipe_id, document):
+        self.remove(recipe_id)
+        terms = Counter(tokenize(document))
+        for term, count in terms.items():
+            self.postings[term][recipe_id] = count
+        self.documents[recipe_id] = terms
+        self.total_length += sum(terms.values())
+
+    def remove(self, recipe_id):
+        terms = self.documents.pop(recipe_id, None)
+        if terms is None:
+            return
+        self.total_length -= sum(terms.values())
+        for term in terms:
+            del self.postings[term][recipe_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query):
+        terms = set(tokenize(query))
+        if not terms or not self.documents:
+            return []
+        postings = [self.postings.get(term, {}) for term in terms]
+        # Как и plainto_tsquery, рецепт должен содержать все слова запроса.
+        matches = set.intersection(*(set(recipes) for recipes in postings))
+        total = len(self.documents)
+        average = self.total_length / total or 1
+        scores = dict.fromkeys(matches, 0.0)
+        for recipes in postings:
+            idf = math.log(1 + (total - len(recipes) + 0.5) / (
+                len(recipes) + 0.5
+            ))
+            for recipe_id in matches:
+                count = recipes[recipe_id]
+                length = sum(self.documents[recipe_id].values())
+                scores[recipe_id] += idf * count * (self.k1 + 1) / (
+                    count + self.k1 * (1 - self.b + self.b * length / average)
+                )
+
+        return sorted(matches, key=lambda pk: (-scores[pk], -pk))
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None}
+
+
+def get_recipe_index():
+    version = get_version(RECIPE_SEARCH_VERSION_KEY)
+    if _state['version'] != version:
+        with _lock:
+            if _state['version'] != version:
+                with primary_reads():
+                    _state['index'] = RecipeSearchIndex(
+                        Recipes.objects.values_list(
+                            'id', 'search_document'
+                        ).iterator()
+                    )
+                _state['version'] = version
+
+    return _state['index']
+
+
+def update_search_documents(recipe_ids):
+    recipe_ids = set(recipe_ids)
+    ingredient_names = defaultdict(list)
+    for recipe_id, name in IngredientsRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('ingredient__name').values_list(
+        'recipe_id', 'ingredient__name'
+    ):
+        ingredient_names[recipe_id].append(name)
+    recipes = list(Recipes.objects.filter(pk__in=recipe_ids).only(
+        'id', 'name', 'text', 'search_document'
+    ))
+    for recipe in recipes:
+        recipe.search_document = build_document(
+            recipe.name, recipe.text, ingredient_names[recipe.id]
+        )
+    Recipes.objects.bulk_update(recipes, ('search_document',))
+
+    # Процесс, изменивший документы, правит свой индекс на месте, а
+    # остальные перестроят его по новой версии.
+    with _lock:
+        index = _state['index']
+        if index is not None:
+            for recipe_id in recipe_ids - {recipe.id for recipe in recipes}:
+                index.remove(recipe_id)
+            for recipe in recipes:
+                index.add(recipe.id, recipe.search_document)
+        version = bump_versions((RECIPE_SEARCH_VERSION_KEY,))
+        if index is not None:
+            _state['version'] = version[RECIPE_SEARCH_VERSION_KEY]
+
+
+def refresh_search_documents(recipe_ids):
+    defer_until_commit(
+        'search_recipe_ids', recipe_ids, flush_search_documents
+    )
+
+
+def flush_search_documents():
+    recipe_ids = take_pending('search_recipe_ids')
+    if recipe_ids:
+        update_search_documents(recipe_ids)
+
+
+class SearchDocument(Func):
+    # Выражение совпадает с функциональным GIN-индексом из миграции.
+    function = 'to_tsvector'
+    template = "%(function)s('{}'::regconfig, %(expressions)s)".format(
+        SEARCH_CONFIG
+    )
+    output_field = SearchVectorField()
+
+
+def search_recipes(queryset, query):
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+
+        return queryset.annotate(
+            search_vector=SearchDocument('search_document'),
+        ).filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(
+                SearchDocument('search_document'), search_query
+            ),
+        ).order_by('-search_rank', '-id')
+
+    recipe_ids = get_recipe_index().search(query)
+    if not recipe_ids:
+        return queryset.none()
+
+    return queryset.filter(pk__in=recipe_ids).annotate(
+        search_rank=Case(
+            *(
+                When(pk=pk, then=Value(position))
+                for position, pk in enumerate(recipe_ids)
+            ),
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank')
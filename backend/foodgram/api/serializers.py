@@ -1,12 +1,23 @@
 import base64
-import webcolors
+import binascii
+import uuid
 
+import webcolors
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image
 from rest_framework import serializers
 
 from recipes.models import (FavouriteRecipe, Ingredients, IngredientsRecipe,
                             Recipes, ShoppingCartRecipe, Tags)
 from users.models import Subscription, User
+from .cache import get_memberships, invalidate_recipe_carts
+from .counters import adjust_user_counters
+from .images import schedule_variants, variant_names
+from .toggles import insert_once
+
+RECIPE_BATCH_MAX = 100
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -54,13 +65,11 @@ class UserSerializer(serializers.ModelSerializer):
         return email
 
     def get_is_subscribed(self, instance):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-            return instance.subscribers.filter(
-                subscriber=request.user
-            ).exists()
+        request = self.context.get('request')
+        if request is None:
+            return False
 
-        return False
+        return instance.id in get_memberships(request)['subscriptions']
 
 
 class ChangePasswordSerializer(serializers.Serializer):
@@ -87,14 +96,52 @@ class ChangePasswordSerializer(serializers.Serializer):
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_bytes} байт',
+        'too_many_pixels': (
+            'Изображение не должно содержать больше {max_pixels} пикселей'
+        ),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
+            # Длина base64 известна до декодирования, поэтому слишком
+            # большие файлы отбрасываются, не занимая память.
+            if len(imgstr) * 3 // 4 > settings.RECIPE_IMAGE_MAX_BYTES:
+                self.fail(
+                    'too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES
+                )
+            try:
+                content = base64.b64decode(imgstr, validate=True)
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = ContentFile(
+                content, name='{}.{}'.format(uuid.uuid4().hex, ext)
+            )
+        elif getattr(data, 'size', 0) > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        if hasattr(data, 'read'):
+            self.check_pixels(data)
 
         return super().to_internal_value(data)
 
+    def check_pixels(self, data):
+        # Image.open читает только заголовок, так что размеры проверяются
+        # до того, как Pillow распакует картинку целиком.
+        try:
+            width, height = Image.open(data).size
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            data.seek(0)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                'too_many_pixels',
+                max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS,
+            )
+
 
 class Hex2NameColor(serializers.Field):
     def to_representation(self, value):
@@ -153,9 +200,7 @@ class IngredientRecipeListSerializer(serializers.ModelSerializer):
 class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(read_only=True)
     amount = serializers.IntegerField(write_only=True, min_value=1)
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredients.objects.all(),
-    )
+    id = serializers.IntegerField()
 
     class Meta:
         model = IngredientsRecipe
@@ -164,10 +209,7 @@ class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
 
 class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientRecipeCreateSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tags.objects.all(),
-        many=True,
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
 
     class Meta:
@@ -186,6 +228,20 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Недопустимо создавать рецепт без указания ингредиентов'
             )
+        ingredient_ids = [ingredient['id'] for ingredient in value]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться'
+            )
+        missing = set(ingredient_ids) - set(Ingredients.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}'.format(
+                    ', '.join(map(str, sorted(missing)))
+                )
+            )
         return value
 
     def validate_tags(self, value):
@@ -193,21 +249,41 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Недопустимо создавать рецепт без указания тега',
             )
-        return value
+        tag_ids = set(value)
+        missing = tag_ids - set(Tags.objects.filter(
+            id__in=tag_ids
+        ).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                'Теги не найдены: {}'.format(
+                    ', '.join(map(str, sorted(missing)))
+                )
+            )
+        return list(tag_ids)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
         tags_data = validated_data.pop('tags')
         recipe = Recipes.objects.create(**validated_data)
 
-        self._save_ingredients(recipe, ingredients_data)
-        for tag in tags_data:
-            recipe.tags.add(tag)
+        IngredientsRecipe.objects.bulk_create(
+            IngredientsRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'],
+            )
+            for ingredient in ingredients_data
+        )
+        recipe.tags.add(*tags_data)
+        adjust_user_counters(recipe.author_id, recipes_count=1)
+        schedule_variants(recipe)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if self.context['request'].user != instance.author:
+        if self.context['request'].user.id != instance.author_id:
             raise serializers.ValidationError(
                 'У вас нет прав обновлять данный рецепт',
             )
@@ -216,33 +292,96 @@ class RecipeSerializer(serializers.ModelSerializer):
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time
         )
-        instance.image = validated_data.get('image', instance.image)
+        if 'image' in validated_data:
+            stale = variant_names(instance)
+            instance.image = validated_data['image']
+            instance.image_thumbnail = ''
+            instance.image_card = ''
+            schedule_variants(instance, stale)
+        instance.save()
 
-        ingredients_data = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self._save_ingredients(instance, ingredients_data)
+        ingredients_data = validated_data.pop('ingredients', None)
+        if ingredients_data is not None:
+            self._update_ingredients(instance, ingredients_data)
 
-        tags_data = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags_data)
+        tags_data = validated_data.pop('tags', None)
+        if tags_data is not None:
+            instance.tags.set(tags_data)
 
-        instance.save()
         return instance
 
-    def _save_ingredients(self, recipe, ingredients_data):
-        for ingredient_data in ingredients_data:
-            ingredient = ingredient_data.get('id')
-            amount = ingredient_data.get('amount')
-            IngredientsRecipe.objects.create(
-                ingredient=ingredient, recipe=recipe, amount=amount
+    def _update_ingredients(self, recipe, ingredients_data):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        existing = {
+            row.ingredient_id: row for row in recipe.ingredients_recipe.all()
+        }
+        stale = [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, row in existing.items():
+            if ingredient_id in amounts and row.amount != amounts[
+                ingredient_id
+            ]:
+                row.amount = amounts[ingredient_id]
+                changed.append(row)
+        added = [
+            IngredientsRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+
+        if stale:
+            IngredientsRecipe.objects.filter(pk__in=stale).delete()
+        if changed:
+            IngredientsRecipe.objects.bulk_update(changed, ('amount',))
+        if added:
+            IngredientsRecipe.objects.bulk_create(added)
+        if changed or added:
+            invalidate_recipe_carts((recipe.id,))
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        if request:
+            instance = Recipes.objects.with_related().get(
+                pk=instance.pk
+            )
+
+        return RecipeListSerializer(instance, context=self.context).data
+
+
+class ImageVariantsMixin:
+
+    def build_image_url(self, image):
+        request = self.context.get('request')
+        if request is None:
+            return image.url
+        # Адрес сервера вычисляется один раз на весь ответ, а не заново
+        # для каждой картинки.
+        if 'absolute_root' not in self.context:
+            self.context['absolute_root'] = request.build_absolute_uri(
+                '/'
+            )[:-1]
+
+        return self.context['absolute_root'] + image.url
+
+    # Пока уменьшенные копии не готовы, отдаётся оригинал.
+    def get_image_thumbnail(self, obj):
+
+        return self.build_image_url(obj.image_thumbnail or obj.image)
 
-        return RecipeListSerializer(instance).data
+    def get_image_card(self, obj):
 
+        return self.build_image_url(obj.image_card or obj.image)
 
-class RecipeListSerializer(serializers.ModelSerializer):
+
+class RecipeListSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = UserSerializer(read_only=True)
     ingredients = IngredientRecipeListSerializer(
@@ -255,22 +394,22 @@ class RecipeListSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_thumbnail = serializers.SerializerMethodField()
+    image_card = serializers.SerializerMethodField()
 
     def get_is_favorited(self, instance):
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-
-            return instance.favourited_by.filter(user=request.user).exists()
+        if request is None:
+            return False
 
-        return False
+        return instance.id in get_memberships(request)['favorites']
 
     def get_is_in_shopping_cart(self, instance):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-
-            return instance.added_to_cart_by.filter(user=request.user).exists()
+        request = self.context.get('request')
+        if request is None:
+            return False
 
-        return False
+        return instance.id in get_memberships(request)['shopping_cart']
 
     class Meta:
         model = Recipes
@@ -285,6 +424,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'is_favorited',
             'is_in_shopping_cart',
             'image',
+            'image_thumbnail',
+            'image_card',
         )
 
 
@@ -308,14 +449,11 @@ class UserListSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': 'True'}}
 
     def get_is_subscribed(self, instance):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-
-            return instance.subscribers.filter(
-                subscriber=request.user
-            ).exists()
+        request = self.context.get('request')
+        if request is None:
+            return False
 
-        return False
+        return instance.id in get_memberships(request)['subscriptions']
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -338,15 +476,14 @@ class FavoriteSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         recipe = self.context.get('recipe')
-        if FavouriteRecipe.objects.filter(
-            user=user,
-            recipe=recipe,
-        ).exists():
+        if not insert_once(
+            FavouriteRecipe, user_id=user.id, recipe_id=recipe.id
+        ):
             raise serializers.ValidationError(
                 {'error': 'Рецепт уже в избранном'},
             )
 
-        return FavouriteRecipe.objects.create(user=user, recipe=recipe)
+        return FavouriteRecipe(user=user, recipe=recipe)
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -369,56 +506,29 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context.get('request').user
         recipe = self.context.get('recipe')
-        if ShoppingCartRecipe.objects.filter(
-            user=user,
-            recipe=recipe
-        ).exists():
+        if not insert_once(
+            ShoppingCartRecipe, user_id=user.id, recipe_id=recipe.id
+        ):
             raise serializers.ValidationError(
                 {'error': 'Рецепт уже в списке покупок'},
             )
 
-        return ShoppingCartRecipe.objects.create(user=user, recipe=recipe)
+        return ShoppingCartRecipe(user=user, recipe=recipe)
 
 
-class UserSubscribeSerializer(serializers.ModelSerializer):
-    id = serializers.ReadOnlyField(source='target_user.id')
-    email = serializers.EmailField(
-        source='target_user.email',
-        required=False,
-    )
-    username = serializers.CharField(
-        source='target_user.username',
-        required=False,
-    )
-    first_name = serializers.CharField(
-        source='target_user.first_name',
-        required=False,
-    )
-    last_name = serializers.CharField(
-        source='target_user.last_name',
-        required=False,
-    )
-    recipes = RecipeListSerializer(
-        source='target_user.recipes',
-        many=True,
-        read_only=True,
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_MAX,
     )
-    recipes_count = serializers.SerializerMethodField()
-    is_subscribed = serializers.SerializerMethodField()
 
-    class Meta:
-        model = Subscription
-        fields = (
-            'email',
-            'id',
-            'username',
-            'first_name',
-            'last_name',
-            'is_subscribed',
-            'recipes',
-            'recipes_count'
-        )
-        read_only_fields = ('__all__',)
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class UserSubscribeSerializer(serializers.Serializer):
+    # Только создаёт подписку: ответ строит UserSubscribeListSerializer.
 
     def create(self, validated_data):
         target_user = self.context.get('target_user')
@@ -427,50 +537,39 @@ class UserSubscribeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'error': 'Нельзя подписаться на самого себя'}
             )
-        if Subscription.objects.filter(
-            subscriber=user,
-            target_user=target_user
-        ).exists():
+        if not insert_once(
+            Subscription, subscriber_id=user.id, target_user_id=target_user.id
+        ):
             raise serializers.ValidationError(
                 {'error': 'Подписка уже существует'}
             )
 
-        return Subscription.objects.create(
-            subscriber=user,
-            target_user=target_user
-        )
-
-    def get_is_subscribed(self, instance):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-
-            return instance.subscriber == request.user
-
-        return False
-
-    def get_recipes_count(self, obj):
+        return Subscription(subscriber=user, target_user=target_user)
 
-        return obj.target_user.recipes.count()
 
-
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(ImageVariantsMixin,
+                            serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    image_thumbnail = serializers.SerializerMethodField()
+    image_card = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipes
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_thumbnail', 'image_card',
+            'cooking_time',
+        )
 
     def get_image(self, obj):
-        request = self.context.get('request')
 
-        return request.build_absolute_uri(obj.image.url)
+        return self.build_image_url(obj.image)
 
 
 class UserSubscribeListSerializer(UserSerializer):
 
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -487,28 +586,22 @@ class UserSubscribeListSerializer(UserSerializer):
         read_only_fields = '__all__',
 
     def get_is_subscribed(self, instance):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
 
-            return instance.subscribers.filter(
-                subscriber=request.user
-            ).exists()
-
-        return False
-
-    def get_recipes_count(self, obj):
-
-        return obj.recipes.count()
+        return super().get_is_subscribed(instance)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'short_recipes'):
+            recipes = obj.short_recipes
+        else:
+            limit = self.context['request'].GET.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = ShortRecipeSerializer(
             recipes,
-            context={'request': request},
+            context=self.context,
             many=True
         )
 
@@ -0,0 +1,80 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import (FavouriteRecipe, Ingredients, IngredientsRecipe,
+                            Recipes, ShoppingCartRecipe, Tags)
+from users.models import Subscription
+from .cache import (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY,
+                    bump_cart_versions, bump_versions, invalidate_membership,
+                    invalidate_recipe_carts, touch_recipes)
+from .images import discard_variants
+from .search import refresh_search_documents
+
+
+@receiver([post_save, post_delete], sender=ShoppingCartRecipe)
+def shopping_cart_changed(sender, instance, **kwargs):
+    invalidate_membership('shopping_cart', instance.user_id)
+    bump_cart_versions((instance.user_id,))
+
+
+# Избранное и подписки меняются и мимо API: в админке и каскадом при
+# удалении рецепта или пользователя.
+@receiver([post_save, post_delete], sender=FavouriteRecipe)
+def favorite_changed(sender, instance, **kwargs):
+    invalidate_membership('favorites', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_membership('subscriptions', instance.subscriber_id)
+
+
+@receiver([post_save, post_delete], sender=Recipes)
+def recipe_changed(sender, instance, **kwargs):
+    refresh_search_documents((instance.pk,))
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_deleted(sender, instance, **kwargs):
+    discard_variants(instance)
+
+
+@receiver([post_save, post_delete], sender=IngredientsRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_carts((instance.recipe_id,))
+    touch_recipes((instance.recipe_id,))
+    refresh_search_documents((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch_recipes((instance.pk,))
+    elif action == 'pre_clear':
+        touch_recipes(instance.recipes.values_list('pk', flat=True))
+    else:
+        touch_recipes(pk_set)
+
+
+@receiver([post_save, post_delete], sender=Ingredients)
+def ingredient_changed(sender, instance, **kwargs):
+    bump_versions((INGREDIENTS_VERSION_KEY,))
+    recipes = Recipes.objects.filter(ingredients=instance)
+    refresh_search_documents(recipes.values_list('pk', flat=True))
+    recipes.update(modified=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Tags)
+def tag_changed(sender, instance, **kwargs):
+    bump_versions((TAGS_VERSION_KEY,))
+
+
+@receiver([post_save, pre_delete], sender=Tags)
+def tag_recipes_changed(sender, instance, **kwargs):
+    # Связи с рецептами удаляются вместе с тегом без сигнала m2m_changed,
+    # поэтому рецепты отмечаются до удаления.
+    Recipes.objects.filter(tags=instance).update(modified=timezone.now())
@@ -0,0 +1,21 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QueryRepetitionTestRunner(DiscoverRunner):
+    # В тестах повторяющиеся запросы роняют тест, а не пишутся в лог,
+    # поэтому N+1 в сериализаторах не проходит незамеченным.
+    #
+    # Чтение с реплик выключено: данные TestCase не зафиксированы, и
+    # соединение зеркала их не видит. Тесты маршрутизации включают его сами.
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.query_detection = override_settings(
+            NPLUSONE_DETECTION='raise', DATABASE_READ_ALIASES=[]
+        )
+        self.query_detection.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.query_detection.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,35 @@
+import json
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from api.utils import SHOPPING_LIST_EXPORTERS
+
+# Так суммы приходят из PostgreSQL: Decimal с двумя знаками.
+INGREDIENTS = [
+    {'name': 'Мука', 'total_amount': Decimal('233.00'),
+     'measurement_unit': 'г'},
+    {'name': 'Молоко', 'total_amount': Decimal('1.50'),
+     'measurement_unit': 'л'},
+]
+
+
+def export(export_format):
+    return ''.join(SHOPPING_LIST_EXPORTERS[export_format](INGREDIENTS))
+
+
+class ShoppingListExportTest(SimpleTestCase):
+
+    def test_json_amounts_are_numbers(self):
+        amounts = [item['amount'] for item in json.loads(export('json'))]
+
+        self.assertEqual(amounts, [233, 1.5])
+        self.assertIsInstance(amounts[0], int)
+        self.assertIsInstance(amounts[1], float)
+
+    def test_text_formats_drop_trailing_zeros(self):
+        self.assertEqual(export('txt'), 'Мука: 233 г\nМолоко: 1.5 л\n')
+        self.assertEqual(export('csv').splitlines()[1:], [
+            'Мука,г,233',
+            'Молоко,л,1.5',
+        ])
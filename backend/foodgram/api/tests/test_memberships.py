@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from api.cache import load_memberships
+from recipes.models import FavouriteRecipe, Recipes
+from users.models import Subscription, User
+
+
+class MembershipInvalidationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.reader, self.author = (
+            User.objects.create_user(
+                username=name, email='{}@example.com'.format(name),
+                password='x',
+            )
+            for name in ('reader', 'author')
+        )
+        self.recipe = Recipes.objects.create(
+            author=self.author, name='Рецепт', text='Текст', cooking_time=5,
+        )
+
+    def test_favorite_changes_outside_api_reset_cache(self):
+        self.assertEqual(load_memberships(self.reader)['favorites'], set())
+
+        favorite = FavouriteRecipe.objects.create(
+            user=self.reader, recipe=self.recipe
+        )
+        self.assertEqual(
+            load_memberships(self.reader)['favorites'], {self.recipe.id}
+        )
+
+        favorite.delete()
+        self.assertEqual(load_memberships(self.reader)['favorites'], set())
+
+    def test_cascade_delete_resets_subscriptions(self):
+        Subscription.objects.create(
+            subscriber=self.reader, target_user=self.author
+        )
+        self.assertEqual(
+            load_memberships(self.reader)['subscriptions'], {self.author.id}
+        )
+
+        self.author.delete()
+        self.assertEqual(
+            load_memberships(self.reader)['subscriptions'], set()
+        )
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from api.nplusone import RepeatedQueryError
+from recipes.models import Tags
+
+
+def tag_names(request):
+    # Классический N+1: отдельный запрос на каждый тег.
+    pks = Tags.objects.order_by('pk').values_list('pk', flat=True)
+
+    return JsonResponse(
+        [Tags.objects.get(pk=pk).name for pk in pks], safe=False
+    )
+
+
+def broken_tag_names(request):
+    tag_names(request)
+    raise ValueError('ошибка представления')
+
+
+urlpatterns = [
+    path('tags/', tag_names),
+    path('broken-tags/', broken_tag_names),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, NPLUSONE_THRESHOLD=2)
+class QueryRepetitionTestRunnerTests(TestCase):
+
+    def create_tags(self, count):
+        Tags.objects.bulk_create(
+            Tags(name='Тег {}'.format(i), color='#00000{}'.format(i),
+                 slug='tag-{}'.format(i))
+            for i in range(count)
+        )
+
+    def test_runner_enables_raise_mode(self):
+        self.assertEqual(settings.NPLUSONE_DETECTION, 'raise')
+
+    def test_repeated_queries_fail_the_test(self):
+        self.create_tags(3)
+        with self.assertRaises(RepeatedQueryError) as raised:
+            self.client.get('/tags/')
+        self.assertIn('3 раз', str(raised.exception))
+        self.assertIn('tag_names', str(raised.exception))
+
+    def test_queries_within_threshold_pass(self):
+        self.create_tags(2)
+        response = self.client.get('/tags/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_view_error_is_not_replaced_by_report(self):
+        self.create_tags(3)
+        with self.assertRaisesMessage(ValueError, 'ошибка представления'):
+            self.client.get('/broken-tags/')
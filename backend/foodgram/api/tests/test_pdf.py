@@ -0,0 +1,42 @@
+import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.utils import CustomPDF
+
+INGREDIENTS = [
+    {'name': 'Мука', 'total_amount': 500, 'measurement_unit': 'г'},
+    {'name': 'Яйца', 'total_amount': 3, 'measurement_unit': 'шт.'},
+] * 30
+
+
+def render_pdf():
+    pdf = CustomPDF()
+    pdf.set_creation_date(
+        datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    )
+
+    return pdf.render(INGREDIENTS)
+
+
+class CustomPDFTest(SimpleTestCase):
+
+    def test_cached_font_matches_public_api(self):
+        # Подстановка шрифта и логотипа во внутренние словари fpdf2 должна
+        # давать тот же документ, что и add_font с image. Если после
+        # обновления fpdf2 тест падает, CACHED_FONT_FPDF_VERSION устарела.
+        cached = render_pdf()
+        with mock.patch('api.utils.FPDF_VERSION', 'public'):
+            public = render_pdf()
+
+        self.assertTrue(cached.startswith(b'%PDF'))
+        self.assertEqual(cached, public)
+
+    def test_documents_do_not_share_font_subsets(self):
+        first = render_pdf()
+        CustomPDF().render([
+            {'name': 'Щавель', 'total_amount': 1, 'measurement_unit': 'кг'},
+        ])
+
+        self.assertEqual(render_pdf(), first)
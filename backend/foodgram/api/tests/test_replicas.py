@@ -0,0 +1,103 @@
+from contextlib import ExitStack
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.models import User
+
+# Тестовый запускатель выключает DATABASE_READ_ALIASES, поэтому реплики
+# берутся из DATABASES.
+REPLICAS = tuple(
+    alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS
+)
+
+
+def make_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+        Token.objects.create(user=user).key
+    ))
+
+    return client
+
+
+# Реплики задаются переменной DB_REPLICAS, в тестах это зеркала основной
+# базы: различается только соединение, через которое идут запросы. Данные
+# фиксируются (TransactionTestCase), чтобы их видело соединение зеркала.
+@skipUnless(REPLICAS, 'DB_REPLICAS не задан')
+@override_settings(DATABASE_READ_ALIASES=list(REPLICAS))
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        self.client = make_client(self.user)
+
+    def read_recipes(self, client):
+        # Лента рецептов не кэшируется, так что её запросы показывают,
+        # какую базу выбрал маршрутизатор.
+        with ExitStack() as stack:
+            primary, *replicas = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in (DEFAULT_DB_ALIAS, *REPLICAS)
+            ]
+            response = client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+
+        return (
+            any(
+                'recipes_recipes' in query['sql']
+                for query in primary.captured_queries
+            ),
+            sum(len(replica.captured_queries) for replica in replicas),
+        )
+
+    def test_safe_request_reads_from_replica(self):
+        from_primary, replica_queries = self.read_recipes(self.client)
+
+        self.assertFalse(from_primary)
+        self.assertGreater(replica_queries, 0)
+
+    def test_successful_write_pins_client_to_primary(self):
+        response = self.client.post(
+            '/api/users/{}/subscribe/'.format(self.author.id)
+        )
+        self.assertEqual(response.status_code, 201)
+
+        from_primary, replica_queries = self.read_recipes(self.client)
+
+        self.assertTrue(from_primary)
+        self.assertEqual(replica_queries, 0)
+
+    def test_pin_is_per_client(self):
+        self.client.post('/api/users/{}/subscribe/'.format(self.author.id))
+
+        from_primary, replica_queries = self.read_recipes(
+            make_client(self.author)
+        )
+
+        self.assertFalse(from_primary)
+        self.assertGreater(replica_queries, 0)
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post(
+            '/api/users/{}/subscribe/'.format(self.user.id)
+        )
+        self.assertEqual(response.status_code, 400)
+
+        from_primary, replica_queries = self.read_recipes(self.client)
+
+        self.assertFalse(from_primary)
+        self.assertGreater(replica_queries, 0)
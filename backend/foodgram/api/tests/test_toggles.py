@@ -0,0 +1,32 @@
+from django.test import TestCase
+
+from api.toggles import delete_rows, insert_once
+from users.models import Subscription, User
+
+
+class TogglesTest(TestCase):
+
+    def setUp(self):
+        self.reader, self.author = (
+            User.objects.create_user(
+                username=name, email='{}@example.com'.format(name),
+                password='x',
+            )
+            for name in ('reader', 'author')
+        )
+
+    def test_insert_once_reports_only_the_first_insert(self):
+        values = {'subscriber': self.reader, 'target_user': self.author}
+
+        self.assertTrue(insert_once(Subscription, **values))
+        self.assertFalse(insert_once(Subscription, **values))
+        self.assertEqual(Subscription.objects.count(), 1)
+
+    def test_delete_rows_returns_deleted_count(self):
+        Subscription.objects.create(
+            subscriber=self.reader, target_user=self.author
+        )
+        lookups = {'subscriber': self.reader, 'target_user': self.author}
+
+        self.assertEqual(delete_rows(Subscription, **lookups), 1)
+        self.assertEqual(delete_rows(Subscription, **lookups), 0)
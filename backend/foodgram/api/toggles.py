@@ -0,0 +1,16 @@
+def insert_once(model, **values):
+    # get_or_create вставляет строку в точке сохранения: повторный или
+    # параллельный запрос упирается в уникальное ограничение, и вместо
+    # IntegrityError находится уже существующая строка. Возвращает, была
+    # ли строка добавлена.
+    _, created = model.objects.get_or_create(**values)
+
+    return created
+
+
+def delete_rows(model, **lookups):
+    # Обычное удаление ORM с сигналами и каскадами. Возвращает число
+    # удалённых строк самой модели.
+    _, deleted = model.objects.filter(**lookups).delete()
+
+    return deleted.get(model._meta.label, 0)
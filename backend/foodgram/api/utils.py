@@ -1,43 +1,158 @@
-from fpdf import FPDF
+import csv
+import io
+import json
+import os
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from fpdf import FPDF, FPDF_VERSION
+from fpdf.fpdf import SubsetMap
+from fpdf.image_parsing import get_img_info, load_image
+
+FONT_FAMILY = 'DejaVu'
+FONT_PATH = os.path.join(
+    settings.BASE_DIR, 'project_static', 'fonts', 'DejaVuSansCondensed.ttf'
+)
+LOGO_PATH = os.path.join(settings.BASE_DIR, 'project_static', 'logo192.png')
+# Готовые шрифт и логотип подставляются во внутренние словари FPDF, формат
+# которых зависит от версии fpdf2. На другой версии документ собирается
+# через публичные add_font и image, медленнее, но правильно.
+CACHED_FONT_FPDF_VERSION = '2.6.1'
+
+
+@lru_cache(maxsize=None)
+def load_font():
+    # Разбор TTF занимает большую часть времени генерации PDF, поэтому
+    # метрики шрифта считываются один раз на процесс, а в каждый документ
+    # копируется готовая запись с собственной картой используемых символов.
+    template = FPDF()
+    template.add_font(FONT_FAMILY, '', FONT_PATH)
+    with open(FONT_PATH, 'rb') as font_file:
+        font_bytes = font_file.read()
+
+    return template.fonts[FONT_FAMILY.lower()], font_bytes
+
+
+@lru_cache(maxsize=None)
+def load_logo():
+    return get_img_info(load_image(LOGO_PATH))
 
 
 class CustomPDF(FPDF):
 
     def __init__(self):
         super().__init__()
-        self.add_font(
-            'DejaVu',
-            '',
-            'project_static/fonts/DejaVuSansCondensed.ttf'
+        if FPDF_VERSION != CACHED_FONT_FPDF_VERSION:
+            self.add_font(FONT_FAMILY, '', FONT_PATH)
+            return
+        font, font_bytes = load_font()
+        reserved = '\x00 '
+        if self.str_alias_nb_pages:
+            reserved += '0123456789' + self.str_alias_nb_pages
+        self.fonts[font['fontkey']] = dict(
+            font,
+            i=len(self.fonts) + 1,
+            ttffile=io.BytesIO(font_bytes),
+            subset=SubsetMap(map(ord, reserved)),
+        )
+        self.images[LOGO_PATH] = dict(
+            load_logo(), i=len(self.images) + 1, usages=0
         )
 
     def header(self):
-        self.image('project_static/logo192.png', self.w / 2 - 16, 8, 33)
-        self.set_font('DejaVu', '', 14)
+        self.image(LOGO_PATH, self.w / 2 - 16, 8, 33)
+        self.set_font(FONT_FAMILY, '', 14)
         self.ln(40)
         self.cell(0, 10, 'Cписок покупок', 0, 0, 'C')
         self.ln(20)
 
     def footer(self):
         self.set_y(-25)
-        self.set_font('DejaVu', '', 14)
+        self.set_font(FONT_FAMILY, '', 14)
         self.set_text_color(128)
         self.cell(0, 10, f"Page {self.page_no()}", 0, 2, 'C')
         self.cell(0, 10, 'Foodgram: lkaydalov.ddns.net', 0, 0, 'C')
 
-    def chapter_body(self, ingredient_dict):
+    def chapter_body(self, ingredients):
 
-        self.set_font('DejaVu', '', 14)
-        for name, details in ingredient_dict.items():
+        self.set_font(FONT_FAMILY, '', 14)
+        for ingredient in ingredients:
             self.cell(
                 0,
                 10,
-                f"{name}: {details['amount']} {details['unit']}",
+                f"{ingredient['name']}: "
+                f"{shopping_amount(ingredient['total_amount'])} "
+                f"{ingredient['measurement_unit']}",
                 ln=1,
             )
 
-    def print_chapter(self, ingredient_dict):
+    def print_chapter(self, ingredients):
 
         self.add_page()
-        self.set_font('DejaVu', '', 14)
-        self.chapter_body(ingredient_dict)
+        self.set_font(FONT_FAMILY, '', 14)
+        self.chapter_body(ingredients)
+
+    def render(self, ingredients):
+        self.print_chapter(ingredients)
+
+        return bytes(self.output())
+
+
+def shopping_amount(value):
+    # Sum по DecimalField отдаёт Decimal: 233 в SQLite и 233.00 в
+    # PostgreSQL. Во всех форматах целое количество выводится целым
+    # числом, дробное — числом без лишних нулей.
+    value = Decimal(value)
+    if value == value.to_integral_value():
+        return int(value)
+
+    return float(value)
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            shopping_amount(ingredient['total_amount']),
+        ))
+
+
+def shopping_list_txt(ingredients):
+    for ingredient in ingredients:
+        yield (
+            f"{ingredient['name']}: "
+            f"{shopping_amount(ingredient['total_amount'])} "
+            f"{ingredient['measurement_unit']}\n"
+        )
+
+
+def shopping_list_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {
+                'name': ingredient['name'],
+                'measurement_unit': ingredient['measurement_unit'],
+                'amount': shopping_amount(ingredient['total_amount']),
+            },
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_LIST_EXPORTERS = {
+    'csv': shopping_list_csv,
+    'txt': shopping_list_txt,
+    'json': shopping_list_json,
+}
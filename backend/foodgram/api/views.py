@@ -1,40 +1,104 @@
-import os
-
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Subquery, Value)
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, permissions, status, views, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.authentication import (SessionAuthentication,
+                                           TokenAuthentication)
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from recipes.models import (FavouriteRecipe, Ingredients, IngredientsRecipe,
-                            Recipes, ShoppingCartRecipe, Tags)
+from recipes.models import Ingredients, IngredientsRecipe, Recipes, Tags
 from users.models import Subscription, User
-from .filters import CustomQueryFilter
+from .cache import (INGREDIENTS_VERSION_KEY, MEMBERSHIPS, TAGS_VERSION_KEY,
+                    bump_cart_versions, cache_stream, get_counters,
+                    get_memberships, increment, invalidate_membership,
+                    shopping_list_key)
+from .counters import (LIST_COUNTERS, adjust_recipe_counters,
+                       adjust_user_counters, recount_recipe_counters)
+from .filters import (CustomQueryFilter, IngredientSearchFilter,
+                      RecipeSearchFilter, ingredient_search_params)
+from .metrics import CONTENT_TYPE, render_metrics, timed, timed_serializer
+from .mixins import (ConditionalGetMixin, ReferenceCacheMixin,
+                     SerializerTimingMixin)
+from .pagination import KeysetPagination
+from .renderers import (CSVRenderer, PDFRenderer, PlainTextRenderer,
+                        ShoppingListJSONRenderer, ShoppingListRenderer)
 from .serializers import (ChangePasswordSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeListSerializer,
-                          RecipeSerializer, ShoppingCartSerializer,
-                          TagSerializer, UserListSerializer, UserSerializer,
+                          IngredientSerializer, RecipeIdsSerializer,
+                          RecipeListSerializer, RecipeSerializer,
+                          ShoppingCartSerializer, TagSerializer,
+                          UserListSerializer, UserSerializer,
                           UserSubscribeListSerializer, UserSubscribeSerializer)
-from .utils import CustomPDF
+from .toggles import delete_rows
+from .utils import SHOPPING_LIST_EXPORTERS, CustomPDF
+
+# Статус рецепта в ответе пакетного запроса: добавление или удаление ->
+# был ли рецепт в списке (None — рецепта нет).
+BATCH_STATUSES = {
+    True: {False: 'added', True: 'exists', None: 'not_found'},
+    False: {True: 'removed', False: 'missing', None: 'not_found'},
+}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, SerializerTimingMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipes.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (
         DjangoFilterBackend,
-        filters.SearchFilter,
+        RecipeSearchFilter,
         filters.OrderingFilter,
     )
     filterset_class = CustomQueryFilter
-    search_fields = ['name']
-    ordering_fields = ['cooking_time']
+    ordering_fields = ['cooking_time', 'favorites_count']
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    pagination_class = KeysetPagination
+    list_modified_fields = ('modified', 'author__modified')
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+
+            return Recipes.objects.with_related()
+
+        return Recipes.objects.all()
+
+    def get_list_validators(self):
+        return (
+            self.get_list_state(),
+            self.get_membership_state(
+                'favorites', 'shopping_cart', 'subscriptions'
+            ),
+        ), None
+
+    def get_detail_validators(self):
+        if not str(self.kwargs['pk']).isdigit():
+            return None
+        row = Recipes.objects.filter(pk=self.kwargs['pk']).values_list(
+            'modified', 'author_id', 'author__modified'
+        ).first()
+        if row is None:
+            return None
+        modified, author_id, author_modified = row
+        memberships = get_memberships(self.request)
+
+        return (
+            row,
+            int(self.kwargs['pk']) in memberships['favorites'],
+            int(self.kwargs['pk']) in memberships['shopping_cart'],
+            author_id in memberships['subscriptions'],
+        ), max(modified, author_modified)
 
     def create(self, request):
-        serializer = RecipeSerializer(data=request.data)
+        serializer = timed_serializer(RecipeSerializer(
+            context={'request': request},
+            data=request.data,
+        ))
         if serializer.is_valid(raise_exception=True):
             serializer.save(author=self.request.user)
 
@@ -48,12 +112,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def partial_update(self, request, pk=None):
         recipe = self.get_object()
-        serializer = RecipeSerializer(
+        serializer = timed_serializer(RecipeSerializer(
             recipe,
             context={'request': request},
             data=request.data,
             partial=True
-        )
+        ))
         if serializer.is_valid(raise_exception=True):
             serializer.save()
 
@@ -64,6 +128,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors,
                         status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        adjust_user_counters(instance.author_id, recipes_count=-1)
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
 
@@ -71,135 +140,251 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return RecipeListSerializer
 
-    @action(detail=True, methods=['POST', 'DELETE'])
-    def favorite(self, request, pk=None):
-        recipe = self.get_object()
-        user = request.user
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        # Ошибки выгрузки списка покупок (401, 404, 406) отдаются в JSON,
+        # а не с типом PDF, CSV или текста, выбранным по формату.
+        if isinstance(response, Response) and isinstance(
+            response.accepted_renderer, ShoppingListRenderer
+        ):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
 
-        if request.method == 'POST':
-            data = {'user': user.id, 'recipe': recipe.id}
-            serializer = FavoriteSerializer(context={
-                'recipe': recipe,
-                'request': request
-            }, data=data)
-            if serializer.is_valid():
-                serializer.save()
-
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED
-                )
+        return response
 
-            return Response(
-                serializer.errors,
-                status=status.HTTP_400_BAD_REQUEST
+    @action(detail=True, methods=['POST', 'DELETE'])
+    @transaction.atomic
+    def favorite(self, request, pk=None):
+        if request.method == 'DELETE':
+            return self.remove_recipe(
+                request,
+                'favorites',
+                {'message': 'Удалено из избранного'},
+                {'error': 'Рецепт не в избранном'},
             )
 
-        try:
-            favorite = FavouriteRecipe.objects.get(
-                user=user.id, recipe=recipe.id,
-            )
-            favorite.delete()
+        recipe = self.get_object()
+        serializer = timed_serializer(FavoriteSerializer(context={
+            'recipe': recipe,
+            'request': request
+        }, data={'user': request.user.id, 'recipe': recipe.id}))
+        if serializer.is_valid():
+            serializer.save()
+            self.recipe_list_changed(request.user, 'favorites', (recipe.id,))
 
             return Response(
-                {'message': 'Удалено из избранного'},
-                status=status.HTTP_204_NO_CONTENT
+                serializer.data,
+                status=status.HTTP_201_CREATED
             )
-        except FavouriteRecipe.DoesNotExist:
 
-            return Response(
-                {'error': 'Рецепт не в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     @action(detail=True, methods=['POST', 'DELETE'])
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
-        recipe = self.get_object()
-        user = request.user
-        data = {'user': user.id, 'recipe': recipe.id}
-        if request.method == 'POST':
-            serializer = ShoppingCartSerializer(context={
-                'recipe': recipe,
-                'request': request,
-            }, data=data)
-            if serializer.is_valid():
-                serializer.save()
-
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED,
-                )
-
-            return Response(
-                serializer.errors,
-                status=status.HTTP_400_BAD_REQUEST,
+        if request.method == 'DELETE':
+            return self.remove_recipe(
+                request,
+                'shopping_cart',
+                {'message': 'Удалено из корзины покупок'},
+                {'error': 'Рецепт не в списке покупок'},
             )
 
-        try:
-            shopping_cart = get_object_or_404(
-                ShoppingCartRecipe, user=user, recipe=recipe
+        recipe = self.get_object()
+        serializer = timed_serializer(ShoppingCartSerializer(context={
+            'recipe': recipe,
+            'request': request,
+        }, data={'user': request.user.id, 'recipe': recipe.id}))
+        if serializer.is_valid():
+            serializer.save()
+            self.recipe_list_changed(
+                request.user, 'shopping_cart', (recipe.id,)
             )
-            shopping_cart.delete()
-
-            return Response({'message': 'Удалено из корзины покупок'})
-        except ShoppingCartRecipe.DoesNotExist:
 
             return Response(
-                {'error': 'Рецепт не в списке покупок'},
-                status=status.HTTP_400_BAD_REQUEST,
+                serializer.data,
+                status=status.HTTP_201_CREATED,
             )
 
-    @action(detail=False, methods=['GET'])
-    def download_shopping_cart(self, request):
-        user = request.user
-        shopping_cart_summary = ShoppingCartRecipe.objects.filter(user=user)
-        recipes_id = [cart.recipe.id for cart in shopping_cart_summary]
-        ingredients_list = IngredientsRecipe.objects.filter(
-            recipe__in=recipes_id
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        ingredient_dict = {}
-        for ingredient in ingredients_list:
-            name = ingredient.ingredient.name
-            unit = ingredient.ingredient.measurement_unit
-            amount = ingredient.amount
-            if name in ingredient_dict:
-                ingredient_dict[name]['amount'] += amount
-            else:
-                ingredient_dict[name] = {'amount': amount, 'unit': unit}
-
-        shopping_list = CustomPDF()
-        shopping_list.print_chapter(ingredient_dict)
-        filename = 'shopping_list.pdf'
-        shopping_list.output(filename)
 
-        with open(filename, 'rb') as pdf_file:
-            response = HttpResponse(
-                pdf_file.read(),
-                content_type='application/pdf'
-            )
-            response['Content-Disposition'] = (
-                'attachment; '
-                'filename="{}"'.format(filename)
-            )
-            os.remove(filename)
+    def remove_recipe(self, request, kind, message, error):
+        # Удаление идёт сразу, без чтения рецепта: число удалённых строк
+        # показывает, был ли рецепт в списке. Рецепт читается только при
+        # неудаче, чтобы отличить 404 от 400.
+        pk = str(self.kwargs['pk'])
+        if pk.isdigit() and delete_rows(
+            MEMBERSHIPS[kind][0], user_id=request.user.id, recipe_id=pk
+        ):
+            self.recipe_list_changed(request.user, kind, (int(pk),), -1)
+
+            return Response(message, status=status.HTTP_204_NO_CONTENT)
+        self.get_object()
+
+        return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+    def recipe_list_changed(self, user, kind, recipe_ids, delta=1):
+        # Счётчики, кэш списков и версия корзины обновляются здесь:
+        # пакетная вставка идёт мимо сигналов модели.
+        adjust_recipe_counters(recipe_ids, **{LIST_COUNTERS[kind]: delta})
+        self.memberships_changed(user, kind)
+
+    def memberships_changed(self, user, kind):
+        invalidate_membership(kind, user.id)
+        if kind == 'shopping_cart':
+            bump_cart_versions((user.id,))
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def favorite_batch(self, request):
+        return self.change_recipe_list(request, 'favorites')
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def shopping_cart_batch(self, request):
+        return self.change_recipe_list(request, 'shopping_cart')
+
+    def change_recipe_list(self, request, kind):
+        # Все рецепты проверяются одним запросом, который заодно отвечает,
+        # какие из них уже в списке. Затем одна вставка или одно удаление
+        # и одно обновление, пересчитывающее счётчики изменённых рецептов.
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        user = request.user
+        model = MEMBERSHIPS[kind][0]
+        listed = dict(Recipes.objects.filter(pk__in=recipe_ids).annotate(
+            listed=Exists(model.objects.filter(
+                user=user, recipe_id=OuterRef('pk'),
+            ))
+        ).order_by().values_list('pk', 'listed'))
+        adding = request.method == 'POST'
+        changed = [pk for pk, present in listed.items() if present != adding]
+        if changed:
+            if adding:
+                model.objects.bulk_create(
+                    (model(user=user, recipe_id=pk) for pk in changed),
+                    ignore_conflicts=True,
+                )
+            else:
+                delete_rows(model, user=user, recipe_id__in=changed)
+            recount_recipe_counters(changed, kind)
+            self.memberships_changed(user, kind)
+
+        return Response({'results': [
+            {'id': pk, 'status': BATCH_STATUSES[adding][listed.get(pk)]}
+            for pk in recipe_ids
+        ]})
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            PDFRenderer,
+            CSVRenderer,
+            PlainTextRenderer,
+            ShoppingListJSONRenderer,
+        ),
+    )
+    def download_shopping_cart(self, request):
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += '; charset={}'.format(renderer.charset)
+        cache_key = shopping_list_key(request.user, renderer.format)
+        content = cache.get(cache_key)
+
+        if content is not None:
+            increment('shopping_list_hits')
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'HIT'
+        else:
+            increment('shopping_list_misses')
+            # Список кэшируется под версией корзины и читается с основной
+            # базы. Выгрузка потоком выполняет запрос уже после ответа
+            # представления, поэтому база задаётся явно.
+            ingredients = IngredientsRecipe.objects.shopping_list(
+                request.user
+            ).using(DEFAULT_DB_ALIAS).iterator()
+            if renderer.format == 'pdf':
+                with timed('pdf'):
+                    content = CustomPDF().render(ingredients)
+                cache.set(
+                    cache_key, content, settings.SHOPPING_LIST_CACHE_TIMEOUT
+                )
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = StreamingHttpResponse(
+                    cache_stream(
+                        cache_key,
+                        SHOPPING_LIST_EXPORTERS[renderer.format](ingredients),
+                    ),
+                    content_type=content_type,
+                )
+            response['X-Cache'] = 'MISS'
+        response['Content-Disposition'] = (
+            'attachment; filename="shopping_list.{}"'.format(renderer.format)
+        )
 
         return response
 
 
-class IngredientsListView(viewsets.ModelViewSet):
+class IngredientsListView(ConditionalGetMixin, ReferenceCacheMixin,
+                          SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Ingredients.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+    filter_backends = (IngredientSearchFilter,)
     http_method_names = ['get']
     pagination_class = None
+    dataset_version_key = INGREDIENTS_VERSION_KEY
+
+    def get_reference_params(self):
+        if self.action != 'list':
+            return None
+
+        return ingredient_search_params(self.request)
+
+    def get_list_validators(self):
+        return self.get_dataset_version(), None
+
+    def get_detail_validators(self):
+        return self.get_dataset_version(), None
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class TagsViewSet(ConditionalGetMixin, ReferenceCacheMixin,
+                  SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Tags.objects.all()
     serializer_class = TagSerializer
     http_method_names = ['get']
     pagination_class = None
+    dataset_version_key = TAGS_VERSION_KEY
+
+    def get_list_validators(self):
+        return self.get_dataset_version(), None
+
+    def get_detail_validators(self):
+        return self.get_dataset_version(), None
 
 
 class ChangePasswordView(views.APIView):
@@ -221,9 +406,31 @@ class ChangePasswordView(views.APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserDetailView(viewsets.ModelViewSet):
+class UserDetailView(ConditionalGetMixin, SerializerTimingMixin,
+                     viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserListSerializer
+    pagination_class = KeysetPagination
+    list_modified_fields = ('modified',)
+
+    def get_list_validators(self):
+        return (
+            self.get_list_state(), self.get_membership_state('subscriptions'),
+        ), None
+
+    def get_detail_validators(self):
+        if not str(self.kwargs['pk']).isdigit():
+            return None
+        modified = User.objects.filter(pk=self.kwargs['pk']).values_list(
+            'modified', flat=True
+        ).first()
+        if modified is None:
+            return None
+        is_subscribed = int(self.kwargs['pk']) in get_memberships(
+            self.request
+        )['subscriptions']
+
+        return (modified, is_subscribed), modified
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
@@ -235,58 +442,114 @@ class UserDetailView(viewsets.ModelViewSet):
     @action(methods=['GET'], detail=False,
             permission_classes=(IsAuthenticated,))
     def me(self, request):
-        serializer = UserListSerializer(request.user)
+        serializer = timed_serializer(UserListSerializer(request.user))
 
         return Response(serializer.data)
 
     @action(detail=True, methods=['POST', 'DELETE'])
+    @transaction.atomic
     def subscribe(self, request, pk=None):
-        target_user = self.get_object()
+        if request.method == 'DELETE':
+            return self.unsubscribe(request)
 
-        if request.method == 'POST':
-            serializer = UserSubscribeSerializer(context={
-                'target_user': target_user,
-                'request': request,
-            }, data=request.data)
-            if serializer.is_valid():
-                serializer.save()
-
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED
-                )
+        target_user = self.get_object()
+        serializer = UserSubscribeSerializer(context={
+            'target_user': target_user,
+            'request': request,
+        }, data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            adjust_user_counters(target_user.id, subscribers_count=1)
+            # Ответ совпадает с элементом списка подписок: короткие рецепты
+            # с учётом recipes_limit одним запросом вместо полных рецептов
+            # с тегами и ингредиентами по одному.
+            subscription = timed_serializer(UserSubscribeListSerializer(
+                self.get_subscriptions_queryset(request).get(
+                    pk=target_user.pk
+                ),
+                context={'request': request},
+            ))
 
             return Response(
-                serializer.errors,
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        try:
-            subscription = Subscription.objects.filter(
-                subscriber=request.user,
-                target_user=target_user
+                subscription.data,
+                status=status.HTTP_201_CREATED
             )
-            subscription.delete()
+
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def unsubscribe(self, request):
+        pk = str(self.kwargs['pk'])
+        if pk.isdigit() and delete_rows(
+            Subscription, subscriber_id=request.user.id, target_user_id=pk
+        ):
+            adjust_user_counters(pk, subscribers_count=-1)
 
             return Response(
                 {'message': 'Удалено из подписок'},
                 status=status.HTTP_204_NO_CONTENT
             )
-        except Subscription.DoesNotExist:
+        self.get_object()
 
-            return Response(
-                {'error': 'Пользователь не в подписках'},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        return Response(
+            {'error': 'Пользователь не в подписках'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def get_subscriptions_queryset(self, request):
+        recipes = Recipes.objects.only(
+            'id', 'author', 'name', 'image', 'image_thumbnail', 'image_card',
+            'cooking_time',
+        )
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        if recipes_limit.isdigit():
+            # Первые N рецептов каждого автора выбираются коррелированным
+            # подзапросом с LIMIT, так что вся страница подписок
+            # получает рецепты одним запросом.
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipes.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(recipes_limit)]
+            ))
+
+        return User.objects.filter(
+            subscribers__subscriber=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='short_recipes')
+        )
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         page_followed_users = self.paginate_queryset(
-            User.objects.filter(subscribers__subscriber=request.user)
+            self.get_subscriptions_queryset(request)
         )
-        serializer = UserSubscribeListSerializer(
+        serializer = timed_serializer(UserSubscribeListSerializer(
             page_followed_users,
             many=True,
             context={'request': request}
-        )
+        ))
 
         return self.get_paginated_response(serializer.data)
+
+
+class CacheStatsView(views.APIView):
+    authentication_classes = (SessionAuthentication, TokenAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+
+        return Response(get_counters())
+
+
+class MetricsView(views.APIView):
+    authentication_classes = (SessionAuthentication, TokenAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+
+        return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
@@ -27,13 +27,16 @@ INSTALLED_APPS = [
     'django_filters',
     'rest_framework.authtoken',
     'djoser',
-    'api',
+    'api.apps.ApiConfig',
     'recipes',
     'users',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.InstrumentationMiddleware',
+    'api.middleware.QueryRepetitionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +85,68 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения перечисляются через запятую: хосты PostgreSQL или, для
+# проверки на SQLite, пути к копиям файла базы.
+REPLICA_SETTING = 'NAME' if 'sqlite3' in os.getenv('DB_ENGINE', '') else 'HOST'
+DATABASE_READ_ALIASES = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1
+):
+    alias = 'replica{}'.format(number)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        TEST={'MIRROR': 'default'},
+        **{REPLICA_SETTING: replica.strip()}
+    )
+    DATABASE_READ_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.PrimaryReplicaRouter']
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 10))
+
+# Версии наборов данных, списки избранного и подписок, закрепление за
+# основной базой и метрики рассчитаны на кэш, общий для всех процессов
+# (в docker-compose это Memcached). LocMemCache годится только для
+# разработки в одном процессе.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Поиск N+1: off, log (по умолчанию при DEBUG) или raise (в тестах).
+NPLUSONE_DETECTION = os.getenv(
+    'NPLUSONE_DETECTION', 'log' if DEBUG else 'off'
+)
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', 5))
+TEST_RUNNER = 'api.test_runner.QueryRepetitionTestRunner'
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', 5))
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+INGREDIENT_SEARCH_IN_MEMORY = os.getenv(
+    'INGREDIENT_SEARCH_IN_MEMORY', 'True'
+) == 'True'
+INGREDIENT_SEARCH_LIMIT = 50
+
+RECIPE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 4096 * 4096
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (640, 480),
+}
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_ASYNC = os.getenv('RECIPE_IMAGE_ASYNC', 'True') == 'True'
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
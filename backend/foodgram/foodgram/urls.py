@@ -3,7 +3,11 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.views import CacheStatsView, MetricsView
+
 urlpatterns = [
+    path('secure/cache-stats/', CacheStatsView.as_view()),
+    path('secure/metrics/', MetricsView.as_view()),
     path('secure/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
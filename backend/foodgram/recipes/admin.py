@@ -1,40 +1,111 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from users.models import Subscription, User
 from .models import (FavouriteRecipe, Ingredients, IngredientsRecipe, Recipes,
                      ShoppingCartRecipe, Tags)
 
+ESTIMATED_COUNT_THRESHOLD = 100000
 
-class UserAdmin(admin.ModelAdmin):
-    list_filter = ('email', 'username',)
+
+class EstimatedCountPaginator(Paginator):
+    # Для большой таблицы без фильтров и поиска число строк берётся из
+    # статистики PostgreSQL, а не из COUNT(*) по всей таблице.
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE relname = %s',
+                    (queryset.model._meta.db_table,),
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class UserAdmin(ScalableAdmin):
+    list_display = (
+        'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'subscribers_count', 'is_staff',
+    )
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('^username', '^email', '^last_name')
+    readonly_fields = ('recipes_count', 'subscribers_count')
+    ordering = ('-id',)
+
+
+class TagsAdmin(ScalableAdmin):
+    list_display = ('name', 'slug', 'color')
+    search_fields = ('name', 'slug')
+    ordering = ('name',)
 
 
 class IngredientsRecipeInline(admin.TabularInline):
     model = IngredientsRecipe
     extra = 1
+    autocomplete_fields = ('ingredient',)
 
 
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorite_count', 'pub_date',)
-    list_filter = ('name', 'author', 'tags',)
-    readonly_fields = ('favorite_count',)
+class RecipeAdmin(ScalableAdmin):
+    list_display = ('name', 'author', 'favorites_count', 'pub_date',)
+    list_select_related = ('author',)
+    list_filter = ('tags',)
+    search_fields = ('name', '^author__username', '^author__email')
+    autocomplete_fields = ('author', 'tags')
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
     inlines = (IngredientsRecipeInline,)
-
-    def favorite_count(self, obj):
-        return obj.favourited_by.count()
-    favorite_count.short_description = "Число добавлений в избранное"
+    ordering = ('-id',)
 
 
-class IngridientAdmin(admin.ModelAdmin):
+class IngridientAdmin(ScalableAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    search_fields = ('^name',)
+    ordering = ('id',)
+
+
+class IngredientsRecipeAdmin(ScalableAdmin):
+    list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe__author', 'ingredient')
+    search_fields = ('^recipe__name', '^ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+    ordering = ('-id',)
+
+
+class UserRecipeAdmin(ScalableAdmin):
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe__author')
+    search_fields = ('^user__username', '^recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    ordering = ('-id',)
+
+
+class SubscriptionAdmin(ScalableAdmin):
+    list_display = ('subscriber', 'target_user')
+    list_select_related = ('subscriber', 'target_user')
+    search_fields = ('^subscriber__username', '^target_user__username')
+    autocomplete_fields = ('subscriber', 'target_user')
+    ordering = ('-id',)
 
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Recipes, RecipeAdmin)
 admin.site.register(Ingredients, IngridientAdmin)
-admin.site.register(Tags)
-admin.site.register(IngredientsRecipe)
-admin.site.register(FavouriteRecipe)
-admin.site.register(ShoppingCartRecipe)
-admin.site.register(Subscription)
+admin.site.register(Tags, TagsAdmin)
+admin.site.register(IngredientsRecipe, IngredientsRecipeAdmin)
+admin.site.register(FavouriteRecipe, UserRecipeAdmin)
+admin.site.register(ShoppingCartRecipe, UserRecipeAdmin)
+admin.site.register(Subscription, SubscriptionAdmin)
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'recipes_ingredients_name_upper_like'
+
+
+def create_index(apps, schema_editor):
+    # Поиск по префиксу (name__istartswith) на PostgreSQL превращается
+    # в UPPER("name"::text) LIKE UPPER(%s) || '%', такой запрос может
+    # использовать только функциональный индекс с text_pattern_ops.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS {} ON recipes_ingredients '
+        '(UPPER(name::text) text_pattern_ops)'.format(INDEX_NAME)
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_auto_20230408_1359'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredients_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='image_card',
+            field=models.ImageField(blank=True, upload_to='recipes/images/cards', verbose_name='Изображение для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, upload_to='recipes/images/thumbnails', verbose_name='Миниатюра'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipes_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['cooking_time', 'id'], name='recipes_cooking_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:49
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_pub_date(apps, schema_editor):
+    Recipes = apps.get_model('recipes', 'Recipes')
+    Recipes.objects.filter(pub_date__isnull=False).update(
+        modified=F('pub_date')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipes_cooking_time_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(copy_pub_date, migrations.RunPython.noop),
+    ]
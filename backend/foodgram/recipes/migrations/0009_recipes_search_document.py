@@ -0,0 +1,59 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:55
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+INDEX_NAME = 'recipes_recipes_search_document_gin'
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipes = apps.get_model('recipes', 'Recipes')
+    IngredientsRecipe = apps.get_model('recipes', 'IngredientsRecipe')
+    ingredient_names = defaultdict(list)
+    for recipe_id, name in IngredientsRecipe.objects.order_by(
+        'ingredient__name'
+    ).values_list('recipe_id', 'ingredient__name').iterator():
+        ingredient_names[recipe_id].append(name)
+    recipes = list(Recipes.objects.only('id', 'name', 'text'))
+    for recipe in recipes:
+        recipe.search_document = '\n'.join(
+            [recipe.name, recipe.text, *ingredient_names[recipe.id]]
+        )
+    Recipes.objects.bulk_update(recipes, ('search_document',), batch_size=500)
+
+
+def create_index(apps, schema_editor):
+    # Выражение индекса должно совпадать с api.search.SearchDocument,
+    # иначе планировщик его не использует.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS {} ON recipes_recipes USING GIN '
+        "(to_tsvector('russian'::regconfig, search_document))".format(
+            INDEX_NAME
+        )
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipes_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
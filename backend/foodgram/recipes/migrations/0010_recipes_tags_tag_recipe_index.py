@@ -0,0 +1,24 @@
+# Generated by Django 2.2.19 on 2026-10-18 06:20
+
+from django.db import migrations
+
+INDEX_NAME = 'recipes_recipes_tags_tag_recipe_idx'
+
+
+class Migration(migrations.Migration):
+    # Таблица связи тегов создаётся Django автоматически, поэтому индекс
+    # (тег, рецепт) для фильтра по тегам добавляется запросом. Уникальное
+    # ограничение (рецепт, тег) уже есть, а у избранного и корзины
+    # составной индекс (пользователь, рецепт) даёт UniqueConstraint.
+
+    dependencies = [
+        ('recipes', '0009_recipes_search_document'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS {} ON recipes_recipes_tags '
+            '(tags_id, recipes_id)'.format(INDEX_NAME),
+            'DROP INDEX IF EXISTS {}'.format(INDEX_NAME),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.19 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipes_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['author', '-id'], name='recipes_author_id_idx'),
+        ),
+    ]
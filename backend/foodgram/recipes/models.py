@@ -1,5 +1,6 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import F, Prefetch, Sum
 
 from users.models import User
 
@@ -35,6 +36,20 @@ class Ingredients(models.Model):
         return f'{self.name} {self.measurement_unit}'
 
 
+class RecipesQuerySet(models.QuerySet):
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_recipe',
+                queryset=IngredientsRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+
 class Recipes(models.Model):
     author = models.ForeignKey(
         User,
@@ -50,6 +65,16 @@ class Recipes(models.Model):
         upload_to='recipes/images',
         verbose_name='Изображение',
     )
+    image_thumbnail = models.ImageField(
+        upload_to='recipes/images/thumbnails',
+        blank=True,
+        verbose_name='Миниатюра',
+    )
+    image_card = models.ImageField(
+        upload_to='recipes/images/cards',
+        blank=True,
+        verbose_name='Изображение для карточки',
+    )
     text = models.TextField(
         verbose_name='Описание',
     )
@@ -70,9 +95,45 @@ class Recipes(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в избранное',
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в корзину',
+    )
+    search_document = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Текст для поиска',
+    )
+
+    objects = RecipesQuerySet.as_manager()
 
     class Meta:
         ordering = ('-id',)
+        indexes = (
+            models.Index(
+                fields=('cooking_time', 'id'),
+                name='recipes_cooking_time_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-id'),
+                name='recipes_author_id_idx',
+            ),
+            models.Index(
+                fields=('favorites_count', 'id'),
+                name='recipes_favorites_count_id_idx',
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -80,6 +141,22 @@ class Recipes(models.Model):
         return f'{self.name} {self.author}'
 
 
+class IngredientsRecipeQuerySet(models.QuerySet):
+
+    def shopping_list(self, user):
+        return self.filter(
+            recipe__in=ShoppingCartRecipe.objects.filter(
+                user=user
+            ).values('recipe')
+        ).values(
+            'ingredient',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by('name', 'measurement_unit')
+
+
 class IngredientsRecipe(models.Model):
     ingredient = models.ForeignKey(
         Ingredients,
@@ -98,6 +175,8 @@ class IngredientsRecipe(models.Model):
         verbose_name='Количество',
     )
 
+    objects = IngredientsRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Ингредиент для рецепта'
         verbose_name_plural = 'Ингредиенты для рецептов'